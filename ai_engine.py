@@ -1,14 +1,36 @@
+import asyncio
+import functools
+import hashlib
 import logging
 import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, List, Tuple
+from sys import intern
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
-import requests
+import httpx
+import orjson
 from google import genai
 from google.genai import types
 
+from database import get_cached_response, store_cached_response
+from retry import backoff_delay, is_transient, retry_async
+
+try:
+    from xai_sdk import Client as _XAIClient
+    from xai_sdk.chat import system as _xai_system, user as _xai_user
+    from xai_sdk.tools import code_execution as _xai_code_execution, web_search as _xai_web_search, x_search as _xai_x_search
+except ImportError:  # Grok is optional; other providers keep working without xai_sdk.
+    _XAIClient = None
+
 logger = logging.getLogger(__name__)
 
+# Source URLs returned alongside a response.
+Citations = Tuple[str, ...]
+
 FRAMEWORK_CONTEXT = """
 You are the 'Grandmaster' Trading Assistant. Your core philosophy is 'Be the Casino, Not the Gambler.'
 - Mindset: Sellers collect premiums upfront for an obligation with a statistical edge.
@@ -26,11 +48,88 @@ Criteria:
 - Management: Close at 50-60% profit. Roll only for a Net Credit.
 """
 
-user_models: Dict[int, str] = {}
+# FRAMEWORK_CONTEXT never changes, so derive its cache-key digest and its
+# serialized OpenAI system message once at import.
+_FRAMEWORK_CONTEXT_BYTES = FRAMEWORK_CONTEXT.encode('utf-8')
+_FRAMEWORK_CONTEXT_HASH = hashlib.sha256(_FRAMEWORK_CONTEXT_BYTES).hexdigest()
+_OPENAI_BODY_PREFIX = b'{"model":"gpt-4o","messages":[' + orjson.dumps({"role": "system", "content": FRAMEWORK_CONTEXT})
+
+# Per-chat model preference, kept as a bounded LRU so memory tracks active
+# chats rather than every chat ever seen.
+USER_MODELS_MAX = 10_000
+user_models: "OrderedDict[int, str]" = OrderedDict()
+
+# Shared async HTTP client for the REST-based providers so concurrent commands
+# overlap on network I/O and reuse keep-alive connections. It lives for the
+# lifetime of the application: opened on startup, closed on shutdown.
+_HTTP: Optional[httpx.AsyncClient] = None
+
+
+# Per-provider cap on in-flight LLM calls so bursts stay under provider rate limits.
+_PROVIDER_SEM: Dict[str, asyncio.Semaphore] = {
+    "gemini": asyncio.Semaphore(int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))),
+    "grok": asyncio.Semaphore(int(os.getenv("GROK_MAX_CONCURRENCY", "4"))),
+    "openai": asyncio.Semaphore(int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))),
+}
+
+# Providers whose SDKs can yield partial output for call_ai_stream.
+STREAMING_PROVIDERS = ('gemini', 'grok', 'openai')
+
+OPENAI_API_BASE = 'https://api.openai.com/v1'
+OPENAI_CHAT_URL = f'{OPENAI_API_BASE}/chat/completions'
+
+# call_ai response cache: key -> (stored_at, (content, citations)). A bounded LRU:
+# /scan prompts embed live prices, so nearly every key is distinct.
+AI_CACHE_MAX = 512
+_AI_CACHE: "OrderedDict[str, Tuple[float, Tuple[str, Citations]]]" = OrderedDict()
+# Cache misses currently being fetched, by call_ai or call_ai_stream: key -> task
+# shared by identical concurrent requests.
+_INFLIGHT: Dict[str, "asyncio.Task[Tuple[str, Citations]]"] = {}
+
+# Attempts for a stream that fails before its first chunk (same budget as retry_async).
+STREAM_TRIES = 3
+# End-of-stream marker on a _produce_stream queue.
+_STREAM_DONE = object()
+
+# Immutable across calls, so build it once instead of per request.
+_GOOGLE_SEARCH_TOOL = types.Tool(google_search=types.GoogleSearch())
+
+
+@functools.lru_cache(maxsize=4)
+def gemini_client(api_key: str) -> genai.Client:
+    return genai.Client(api_key=api_key)
+
+
+@functools.lru_cache(maxsize=4)
+def _xai_client(api_key: str):
+    return _XAIClient(api_key=api_key)
+
+
+def http_client() -> httpx.AsyncClient:
+    """Return the shared HTTP client, creating it on first use."""
+    global _HTTP
+    if _HTTP is None or _HTTP.is_closed:
+        _HTTP = httpx.AsyncClient(
+            http2=True,
+            timeout=60,
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64, keepalive_expiry=60),
+        )
+    return _HTTP
+
+
+async def close_http_client() -> None:
+    """Close the shared HTTP client. Registered as an application shutdown hook."""
+    global _HTTP
+    if _HTTP is not None:
+        await _HTTP.aclose()
+        _HTTP = None
 
 
 def set_user_model(chat_id: int, model: str) -> None:
     user_models[chat_id] = model
+    user_models.move_to_end(chat_id)
+    if len(user_models) > USER_MODELS_MAX:
+        user_models.popitem(last=False)
 
 
 def resolve_model(chat_id: int, command: str) -> str:
@@ -43,7 +142,11 @@ def resolve_model(chat_id: int, command: str) -> str:
         return 'grok'
     if command in ('scan', 'manage', 'manageid'):
         return 'gemini'
-    return user_models.get(chat_id, 'gemini')
+    model = user_models.get(chat_id)
+    if model is None:
+        return 'gemini'
+    user_models.move_to_end(chat_id)
+    return model
 
 
 def _extract_response_text(response) -> str:
@@ -51,25 +154,104 @@ def _extract_response_text(response) -> str:
     Some Gemini responses (especially tool calls) may not populate .text directly.
     This helper stitches together any text parts so we always return something user-visible.
     """
-    if getattr(response, "text", None):
-        return response.text
+    text = getattr(response, "text", None)
+    if text:
+        return text
 
     text_parts = []
-    for candidate in getattr(response, "candidates", []) or []:
-        content = getattr(candidate, "content", None)
-        if not content:
-            continue
-        for part in getattr(content, "parts", []) or []:
-            part_text = getattr(part, "text", None)
-            if part_text:
-                text_parts.append(part_text)
+    try:
+        for candidate in response.candidates or ():
+            content = candidate.content
+            if content is None:
+                continue
+            for part in content.parts or ():
+                part_text = part.text
+                if part_text:
+                    text_parts.append(part_text)
+    except AttributeError:
+        # Malformed or partial objects (e.g. tool-call only chunks); keep what we have.
+        pass
     return "\n".join(text_parts).strip()
 
 
+def _grok_chat(system_context: str, prompt: str):
+    """Create a Grok chat primed with the system context and the user prompt."""
+    if _XAIClient is None:
+        raise ValueError("xai_sdk is not installed; Grok is unavailable.")
+
+    api_key = os.getenv('XAI_API_KEY') or os.getenv('GROK_API_KEY')
+    if not api_key:
+        raise ValueError("XAI_API_KEY or GROK_API_KEY not set.")
+
+    client = _xai_client(api_key)
+
+    chat_kwargs = {
+        "model": "grok-4-1-fast",
+        "tools": list(_grok_tools()),
+        "include": ["inline_citations"]
+    }
+
+    chat = client.chat.create(**chat_kwargs)
+    chat.append(_grok_system_message(system_context))
+    chat.append(_xai_user(prompt))
+    return chat
+
+
+@functools.lru_cache(maxsize=1)
+def _grok_tools() -> tuple:
+    return (_xai_web_search(), _xai_code_execution(), _xai_x_search())
+
+
+@functools.lru_cache(maxsize=8)
+def _grok_system_message(system_context: str):
+    """
+    Built once per context. Every Grok request starts with the same system
+    message, which keeps the prefix identical for xAI's prompt caching.
+    """
+    return _xai_system(system_context)
+
+
+def _iter_grok_chunks(chat, final: List[object]) -> Iterator[str]:
+    """
+    Yield Grok content chunks synchronously, leaving the last response object
+    in final[0] so citations can be read once the stream ends. The xai_sdk
+    client is blocking, so callers drive this from a worker thread.
+    """
+    try:
+        for response, chunk in chat.stream():
+            final[0] = response
+            chunk_text = getattr(chunk, "content", None)
+            if chunk_text:
+                yield chunk_text
+    except AttributeError:
+        logger.info("xai_sdk chat object does not support streaming; falling back to sample().")
+        final[0] = chat.sample()
+        fallback_content = getattr(final[0], "content", "") or ""
+        if fallback_content:
+            yield fallback_content
+
+
+def _grok_citations(final_response) -> Citations:
+    # Interned so repeated source URLs across calls share one string object.
+    raw_citations = getattr(final_response, "citations", None) or []
+    urls = (entry if isinstance(entry, str) else getattr(entry, "url", None) for entry in raw_citations)
+    return tuple(intern(url) for url in urls if url)
+
+
+def append_sources(text: str, citations: Iterable[str]) -> str:
+    """Append a de-duplicated Sources block to a response, if there are citations."""
+    # dict.fromkeys keeps first-seen order with O(1) membership checks.
+    deduped = dict.fromkeys(url for url in citations if url)
+    if not deduped:
+        return text
+    sources_block = "\n".join(f"- {url}" for url in deduped)
+    return f"{text}\n\nSources:\n{sources_block}"
+
+
 def build_ticker_sentiment_prompt(tickers: List[str], sector_map: Dict[str, str]) -> str:
-    sectors_lines = "\n".join([f"- {t}: {sector_map.get(t, 'Unknown')}" for t in tickers])
-    unique_sectors = [s for s in dict.fromkeys(sector_map.values())]
-    aggregate = ", ".join(unique_sectors) if unique_sectors else "Unknown"
+    sector_of = sector_map.get
+    sectors_lines = "\n".join(f"- {t}: {sector_of(t, 'Unknown')}" for t in tickers)
+    aggregate = ", ".join(dict.fromkeys(sector_map.values())) or "Unknown"
     return (
         f"Tickers analyzed: {', '.join(tickers)}\n\n"
         f"Derived sectors:\n{sectors_lines}\n\n"
@@ -79,135 +261,439 @@ def build_ticker_sentiment_prompt(tickers: List[str], sector_map: Dict[str, str]
     )
 
 
+MANAGE_PROMPT = (
+    "Manage {ticker}. {entry_info}. Current Market Price: ${price}.{dma_info} "
+    "Today: {today}. "
+    "Calculate current profit/loss based on decay. "
+    "Evaluate 50% profit target and provide Net Credit Roll advice."
+)
+
+
+@functools.lru_cache(maxsize=1)
+def _today_str(epoch_minute: int) -> str:
+    """Today's date, recomputed at most once per minute (the argument is the cache key)."""
+    return datetime.now().strftime('%Y-%m-%d')
+
+
 def build_manage_prompt(trade: Dict, market: Dict) -> str:
+    strike = trade['strike']
+    premium = trade['entry_price']
+    t_type = trade['type']
+    expiry = trade['expiry']
+    opened = trade['date']
+
     # Detect if this is a spread (has long_strike)
-    long_strike = trade.get('long_strike')
+    long_strike = trade['long_strike']
     
     if long_strike:
         # It's a spread - calculate max risk
-        spread_width = abs(trade['strike'] - long_strike)
-        max_risk = spread_width - trade['entry_price']  # width - credit received
+        spread_width = abs(strike - long_strike)
+        max_risk = spread_width - premium  # width - credit received
         entry_info = (
-            f"Position: {trade['type']} Credit Spread @ Short Strike: ${trade['strike']} "
+            f"Position: {t_type} Credit Spread @ Short Strike: ${strike} "
             f"/ Long Strike: ${long_strike} (Width: ${spread_width:.2f}). "
-            f"Net Premium Collected: ${trade['entry_price']}. "
+            f"Net Premium Collected: ${premium}. "
             f"Max Risk: ${max_risk:.2f} per spread. "
-            f"Expiry: {trade['expiry']} (Opened: {trade['date']})"
+            f"Expiry: {expiry} (Opened: {opened})"
         )
     else:
         # Single leg (CSP or CC)
         entry_info = (
-            f"Position: {trade['type']} @ Strike: ${trade['strike']}. "
-            f"Premium Collected: ${trade['entry_price']}. "
-            f"Expiry: {trade['expiry']} (Opened: {trade['date']})"
+            f"Position: {t_type} @ Strike: ${strike}. "
+            f"Premium Collected: ${premium}. "
+            f"Expiry: {expiry} (Opened: {opened})"
         )
 
     dma_info = ""
     if market.get('dma_50') != 'N/A' and market.get('dma_200') != 'N/A':
         dma_info = f" 50-DMA: ${market['dma_50']:.2f}, 200-DMA: ${market['dma_200']:.2f}."
 
-    return (
-        f"Manage {trade['ticker']}. {entry_info}. Current Market Price: ${market['price']}.{dma_info} "
-        f"Today: {datetime.now().strftime('%Y-%m-%d')}. "
-        f"Calculate current profit/loss based on decay. "
-        f"Evaluate 50% profit target and provide Net Credit Roll advice."
-    )
+    return MANAGE_PROMPT.format_map({
+        "ticker": trade['ticker'],
+        "entry_info": entry_info,
+        "price": market['price'],
+        "dma_info": dma_info,
+        "today": _today_str(int(time.time() // 60)),
+    })
 
 
-async def call_ai(model: str, prompt: str, system_context: str = FRAMEWORK_CONTEXT, task_type: str = "speed") -> Tuple[str, List[str]]:
-    citations: List[str] = []
+def _gemini_request(system_context: str, task_type: str) -> Tuple[genai.Client, str, types.GenerateContentConfig]:
+    """Resolve the client, model name and generation config for a Gemini call."""
+    api_key = os.getenv('GEMINI_API_KEY')
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY not set in environment.")
 
-    if model == 'grok':
-        from xai_sdk import Client
-        from xai_sdk.chat import user, system
-        from xai_sdk.tools import web_search, code_execution, x_search
+    model_name = 'gemini-2.5-pro' if task_type == 'reasoning' else 'gemini-2.5-flash'
+    return gemini_client(api_key), model_name, _gemini_config(system_context, task_type)
 
-        api_key = os.getenv('XAI_API_KEY') or os.getenv('GROK_API_KEY')
-        if not api_key:
-            raise ValueError("XAI_API_KEY or GROK_API_KEY not set.")
 
-        client = Client(api_key=api_key)
+@functools.lru_cache(maxsize=16)
+def _gemini_config(system_context: str, task_type: str) -> types.GenerateContentConfig:
+    """Generation config per (context, task type); built once since the framework context never changes."""
+    temperature = 0.2 if task_type == 'reasoning' else 0.7
 
-        chat_kwargs = {
-            "model": "grok-4-1-fast",
-            "tools": [web_search(), code_execution(), x_search()],
-            "include": ["inline_citations"]
-        }
+    config_kwargs = {
+        "system_instruction": system_context,
+        "tools": [_GOOGLE_SEARCH_TOOL],
+        "temperature": temperature,
+    }
 
-        chat = client.chat.create(**chat_kwargs)
-        chat.append(system(system_context))
-        chat.append(user(prompt))
+    if task_type == 'reasoning':
+        thinking_cls = getattr(types, "ThinkingConfig", None)
+        if thinking_cls:
+            config_kwargs["thinking_config"] = thinking_cls()
 
-        final_response = None
-        content_parts: List[str] = []
+    return types.GenerateContentConfig(**config_kwargs)
 
-        try:
-            for response, chunk in chat.stream():
-                final_response = response
-                chunk_text = getattr(chunk, "content", None)
-                if chunk_text:
-                    content_parts.append(chunk_text)
-        except AttributeError:
-            logger.info("xai_sdk chat object does not support streaming; falling back to sample().")
-            final_response = chat.sample()
-            fallback_content = getattr(final_response, "content", "") or ""
-            if fallback_content:
-                content_parts.append(fallback_content)
-
-        content = "".join(content_parts).strip()
-        if not content and final_response:
-            content = getattr(final_response, "content", "") or ""
-
-        raw_citations = getattr(final_response, "citations", None) or []
-        for entry in raw_citations:
-            url = entry if isinstance(entry, str) else getattr(entry, "url", None)
-            if url:
-                citations.append(url)
-
-        return content, citations
 
-    if model == 'openai':
-        url = 'https://api.openai.com/v1/chat/completions'
-        headers = {'Authorization': f"Bearer {os.getenv('OPENAI_API_KEY')}", 'Content-Type': 'application/json'}
-        body = {"model": "gpt-4o", "messages": [{"role": "system", "content": system_context}, {"role": "user", "content": prompt}]}
-        content = requests.post(url, headers=headers, json=body).json()['choices'][0]['message']['content']
-        return content, citations
+async def _iterate_in_thread(make_iterator: Callable[[], Iterable[str]]) -> AsyncIterator[str]:
+    """
+    Bridge a blocking iterator onto the event loop. A worker thread drains the
+    iterator into an asyncio.Queue and the caller consumes items as they land.
+    If the caller stops early, the worker stops at the next chunk instead of
+    reading the rest of the stream.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+    stop = threading.Event()
 
-    if model == 'gemini':
+    def _put(item) -> None:
         try:
-            api_key = os.getenv('GEMINI_API_KEY')
-            if not api_key:
-                raise ValueError("GEMINI_API_KEY not set in environment.")
-
-            client = genai.Client(api_key=api_key)
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:  # loop already closed; nobody is listening
+            pass
 
-            model_name = 'gemini-2.5-pro' if task_type == 'reasoning' else 'gemini-2.5-flash'
-            temperature = 0.2 if task_type == 'reasoning' else 0.7
-
-            config_kwargs = {
-                "system_instruction": system_context,
-                "tools": [types.Tool(google_search=types.GoogleSearch())],
-                "temperature": temperature,
-            }
-
-            if task_type == 'reasoning':
-                thinking_cls = getattr(types, "ThinkingConfig", None)
-                if thinking_cls:
-                    config_kwargs["thinking_config"] = thinking_cls()
-
-            config = types.GenerateContentConfig(**config_kwargs)
+    def _produce() -> None:
+        iterator = None
+        try:
+            iterator = iter(make_iterator())
+            for item in iterator:
+                if stop.is_set():
+                    break
+                _put(item)
+        except Exception as exc:  # noqa: BLE001
+            _put(exc)
+        finally:
+            # Runs the generator's cleanup here, so the underlying stream is released.
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+            _put(done)
+
+    loop.run_in_executor(None, _produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Not awaited: a worker blocked waiting on the next chunk would hold up
+        # the caller's cancellation. It exits on its own once that chunk arrives.
+        stop.set()
+
+
+async def call_ai_stream(
+    model: str,
+    prompt: str,
+    system_context: str = FRAMEWORK_CONTEXT,
+    task_type: str = "speed",
+    cache_ttl: float = 0,
+) -> AsyncIterator[str]:
+    """
+    Yield response text incrementally. Gemini, Grok and OpenAI stream chunks as
+    they are generated (Grok's Sources block follows the text); other providers
+    yield their full response once.
+    """
+    if model not in STREAMING_PROVIDERS:
+        content, _ = await call_ai(model, prompt, system_context, task_type, cache_ttl)
+        yield content
+        return
+
+    key = _cache_key(model, task_type, system_context, prompt) if cache_ttl > 0 else None
+    cached = await _cache_get(key, cache_ttl) if key else None
+    if cached:
+        content, citations = cached
+        yield append_sources(content, citations)
+        return
+
+    # Single-flight, shared with call_ai: an identical request already in progress
+    # (streamed or not) is awaited and its finished text sent in one piece.
+    shared = _INFLIGHT.get(key) if key else None
+    if shared is not None:
+        try:
+            content, citations = await asyncio.shield(shared)
+        except Exception as e:
+            logger.error("%s API Error: %s", model.capitalize(), e)
+            yield f"⚠️ AI Error: {str(e)}"
+            return
+        yield append_sources(content, citations) if content else f"⚠️ AI Error: Empty response from {model.capitalize()}."
+        return
+
+    queue: asyncio.Queue = asyncio.Queue()
+    producer = asyncio.ensure_future(_produce_stream(model, prompt, system_context, task_type, queue, key))
+    producer.add_done_callback(lambda _: queue.put_nowait(_STREAM_DONE))
+    if key:
+        _INFLIGHT[key] = producer
+        producer.add_done_callback(lambda _: _INFLIGHT.pop(key, None))
+
+    parts: List[str] = []
+    try:
+        while (text := await queue.get()) is not _STREAM_DONE:
+            parts.append(text)
+            yield text
+        content, citations = producer.result()
+    except Exception as e:
+        logger.error("%s API Error: %s", model.capitalize(), e)
+        yield f"⚠️ AI Error: {str(e)}"
+        return
+    finally:
+        # A consumer that stops early (or is cancelled) shouldn't leave the provider
+        # call running, unless other requests may be waiting on it.
+        if not key:
+            producer.cancel()
+
+    if not parts:
+        yield f"⚠️ AI Error: Empty response from {model.capitalize()}."
+        return
+
+    if citations:
+        yield append_sources("", citations)
+
+
+def _provider_stream(model: str, prompt: str, system_context: str, task_type: str, final: List[object]) -> AsyncIterator[str]:
+    if model == 'openai':
+        return _stream_openai(prompt, system_context)
+    if model == 'gemini':
+        return _stream_gemini(prompt, system_context, task_type)
+    chat = _grok_chat(system_context, prompt)
+    return _iterate_in_thread(lambda: _iter_grok_chunks(chat, final))
 
-            response = client.models.generate_content(
-                model=model_name,
-                contents=prompt,
-                config=config,
-            )
 
-            result_text = _extract_response_text(response)
-            content = result_text or "⚠️ AI Error: Empty response from Gemini."
-            return content, citations
+async def _produce_stream(
+    model: str, prompt: str, system_context: str, task_type: str, queue: asyncio.Queue, key: Optional[str] = None
+) -> Tuple[str, Citations]:
+    """
+    Pull a provider stream into queue and return the full text. The provider
+    slot is held only while pulling, so a consumer stuck on Telegram edits or
+    flood-control waits doesn't keep other users' LLM calls queued.
+    Transient errors are retried until the first chunk has gone out; after
+    that a retry would repeat text the user has already seen.
+    """
+    for attempt in range(STREAM_TRIES):
+        parts: List[str] = []
+        final: List[object] = [None]
+        try:
+            async with _PROVIDER_SEM[model]:
+                async for text in _provider_stream(model, prompt, system_context, task_type, final):
+                    parts.append(text)
+                    queue.put_nowait(text)
+            break
         except Exception as e:
-            logger.error("Gemini API Error: %s", e)
-            return f"⚠️ AI Error: {str(e)}", citations
+            if parts or not is_transient(e) or attempt == STREAM_TRIES - 1:
+                raise
+            # Back off outside the provider slot.
+            delay = backoff_delay(attempt)
+            logger.warning("Transient %s stream error (%s), retry %d/%d in %.2fs", model, e, attempt + 1, STREAM_TRIES - 1, delay)
+            await asyncio.sleep(delay)
+    citations = _grok_citations(final[0]) if model == 'grok' else ()
+    if not parts and model == 'grok' and final[0] is not None:
+        # Same fallback as _call_grok: some responses carry their text only on the final object.
+        fallback = getattr(final[0], "content", "") or ""
+        if fallback:
+            parts.append(fallback)
+            queue.put_nowait(fallback)
+    content = "".join(parts)
+    # Cached here rather than by the consumer, so the result is kept even if that request went away.
+    if key:
+        await _cache_put(key, model, content, citations)
+    return content, citations
+
+
+def _cache_key(model: str, task_type: str, system_context: str, prompt: str) -> str:
+    context_id = _FRAMEWORK_CONTEXT_HASH if system_context == FRAMEWORK_CONTEXT else system_context
+    # Prompts differing only in case or spacing ("Tech  Stocks" vs "tech stocks") share an entry.
+    normalized = " ".join(prompt.split()).casefold()
+    return hashlib.sha256(f"{model}|{task_type}|{context_id}|{normalized}".encode()).hexdigest()
+
+
+async def _cache_get(key: str, ttl: float) -> Optional[Tuple[str, Citations]]:
+    """Look up a cached response in memory, then in SQLite (which survives restarts)."""
+    now = time.time()
+    cached = _AI_CACHE.get(key)
+    if cached:
+        if now - cached[0] < ttl:
+            _AI_CACHE.move_to_end(key)
+            return cached[1]
+        del _AI_CACHE[key]
+
+    try:
+        stored = await asyncio.to_thread(get_cached_response, key, ttl)
+    except sqlite3.Error as e:
+        logger.warning("Response cache read failed: %s", e)
+        return None
+    if stored is None:
+        return None
+    _remember(key, stored)
+    return stored[1]
+
+
+def _remember(key: str, entry: Tuple[float, Tuple[str, Citations]]) -> None:
+    _AI_CACHE[key] = entry
+    _AI_CACHE.move_to_end(key)
+    if len(_AI_CACHE) > AI_CACHE_MAX:
+        _AI_CACHE.popitem(last=False)
+
+
+async def _cache_put(key: str, model: str, content: str, citations: Citations) -> None:
+    # Never cache provider errors; the next request should retry.
+    if not content or content.startswith("⚠️"):
+        return
+    _remember(key, (time.time(), (content, citations)))
+    try:
+        await asyncio.to_thread(store_cached_response, key, model, content, citations)
+    except sqlite3.Error as e:
+        logger.warning("Response cache write failed: %s", e)
+
+
+def _openai_body(system_context: str, prompt: str, stream: bool = False) -> bytes:
+    """Serialize a chat completion request, splicing in the cached system message when possible."""
+    user_message = orjson.dumps({"role": "user", "content": prompt})
+    if system_context == FRAMEWORK_CONTEXT:
+        return _OPENAI_BODY_PREFIX + b"," + user_message + (b'],"stream":true}' if stream else b"]}")
+    body = {"model": "gpt-4o", "messages": [{"role": "system", "content": system_context}, {"role": "user", "content": prompt}]}
+    if stream:
+        body["stream"] = True
+    return orjson.dumps(body)
+
+
+async def call_ai(
+    model: str,
+    prompt: str,
+    system_context: str = FRAMEWORK_CONTEXT,
+    task_type: str = "speed",
+    cache_ttl: float = 0,
+) -> Tuple[str, Citations]:
+    """
+    Run a prompt against the selected provider.
+    When cache_ttl > 0, identical requests within that many seconds are served
+    from cache (memory first, then the responses table) instead of a new LLM
+    round-trip.
+    """
+    if cache_ttl <= 0:
+        return await _call_provider(model, prompt, system_context, task_type)
+
+    key = _cache_key(model, task_type, system_context, prompt)
+    cached = await _cache_get(key, cache_ttl)
+    if cached:
+        return cached
+
+    # Single-flight: identical requests arriving while one is in progress share its result.
+    task = _INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_and_cache(key, model, prompt, system_context, task_type))
+        _INFLIGHT[key] = task
+        task.add_done_callback(lambda _: _INFLIGHT.pop(key, None))
+    # Shielded so one cancelled caller doesn't cancel the fetch for the others.
+    return await asyncio.shield(task)
+
+
+async def _fetch_and_cache(key: str, model: str, prompt: str, system_context: str, task_type: str) -> Tuple[str, Citations]:
+    content, citations = await _call_provider(model, prompt, system_context, task_type)
+    await _cache_put(key, model, content, citations)
+    return content, citations
+
+
+async def _call_provider(model: str, prompt: str, system_context: str, task_type: str) -> Tuple[str, Citations]:
+    provider = _PROVIDERS.get(model)
+    if provider is None:
+        return "⚠️ Unsupported model selection.", ()
+
+    async def attempt() -> Tuple[str, Citations]:
+        # Hold the provider slot per attempt, not across backoff sleeps.
+        async with _PROVIDER_SEM[model]:
+            return await provider(prompt, system_context, task_type)
+
+    return await retry_async(attempt)
+
+
+async def _call_grok(prompt: str, system_context: str, task_type: str) -> Tuple[str, Citations]:
+    chat = _grok_chat(system_context, prompt)
+    final: List[object] = [None]
+    content_parts = await asyncio.to_thread(lambda: list(_iter_grok_chunks(chat, final)))
+    final_response = final[0]
+
+    content = "".join(content_parts).strip()
+    if not content and final_response:
+        content = getattr(final_response, "content", "") or ""
+
+    return content, _grok_citations(final_response)
+
+
+def _openai_headers() -> Dict[str, str]:
+    return {'Authorization': f"Bearer {os.getenv('OPENAI_API_KEY')}", 'Content-Type': 'application/json'}
+
+
+async def _call_openai(prompt: str, system_context: str, task_type: str) -> Tuple[str, Citations]:
+    resp = await http_client().post(OPENAI_CHAT_URL, headers=_openai_headers(), content=_openai_body(system_context, prompt))
+    resp.raise_for_status()
+    data = orjson.loads(resp.content)
+    content = data['choices'][0]['message']['content']
+    return content, ()
+
+
+async def _stream_openai(prompt: str, system_context: str) -> AsyncIterator[str]:
+    """Yield content deltas from an OpenAI chat completion server-sent event stream."""
+    body = _openai_body(system_context, prompt, stream=True)
+    async with http_client().stream("POST", OPENAI_CHAT_URL, headers=_openai_headers(), content=body) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            payload = line[6:]
+            if payload == "[DONE]":
+                break
+            choices = orjson.loads(payload).get("choices")
+            text = choices[0].get("delta", {}).get("content") if choices else None
+            if text:
+                yield text
+
+
+async def _stream_gemini(prompt: str, system_context: str, task_type: str) -> AsyncIterator[str]:
+    client, model_name, config = _gemini_request(system_context, task_type)
+    stream = await client.aio.models.generate_content_stream(model=model_name, contents=prompt, config=config)
+    async for chunk in stream:
+        text = _extract_response_text(chunk)
+        if text:
+            yield text
+
+
+async def _call_gemini(prompt: str, system_context: str, task_type: str) -> Tuple[str, Citations]:
+    try:
+        client, model_name, config = _gemini_request(system_context, task_type)
+
+        # The SDK's native async client, so no worker thread is tied up for the call.
+        response = await client.aio.models.generate_content(
+            model=model_name,
+            contents=prompt,
+            config=config,
+        )
 
-    return "⚠️ Unsupported model selection.", citations
+        result_text = _extract_response_text(response)
+        content = result_text or "⚠️ AI Error: Empty response from Gemini."
+        return content, ()
+    except Exception as e:
+        if is_transient(e):
+            raise
+        logger.error("Gemini API Error: %s", e)
+        return f"⚠️ AI Error: {str(e)}", ()
+
+
+_PROVIDERS: Dict[str, Callable[[str, str, str], Awaitable[Tuple[str, Citations]]]] = {
+    'grok': _call_grok,
+    'openai': _call_openai,
+    'gemini': _call_gemini,
+}
@@ -1,27 +1,18 @@
+import asyncio
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, time, timedelta
 
 from dotenv import load_dotenv
-from telegram.ext import Application, CommandHandler, MessageHandler, filters
+from telegram.ext import Application
 from telegram.request import HTTPXRequest
 
-from database import init_db
-from handlers import (
-    confirm_trade,
-    edit_trade,
-    handle_photo,
-    help_command,
-    manage,
-    manage_by_id,
-    open_trade,
-    positions,
-    scan,
-    sentiment,
-    setmodel,
-    start,
-)
+from ai_engine import close_http_client, http_client
+from database import get_open_tickers, init_db
+from handlers import register_all
 from jobs import EST, schedule_weekday_jobs, scheduled_market_scan
+from market_data import WARM_TICKERS, warm_market_data
 
 load_dotenv()
 
@@ -33,29 +24,50 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+async def _post_init(application: Application) -> None:
+    # Blocking calls (Grok's SDK, yfinance, SQLite) run on the default executor;
+    # size it for concurrent commands rather than the CPU-count based default.
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=32))
+    # Open the shared AI HTTP client inside the running loop it will serve.
+    http_client()
+    # Prime market data in the background so startup isn't held up by yfinance.
+    application.create_task(_warm_market_cache())
+
+
+async def _warm_market_cache() -> None:
+    # Users' open positions are what /manage and the scheduled scan hit first.
+    open_tickers = await asyncio.to_thread(get_open_tickers)
+    await warm_market_data(tuple(dict.fromkeys((*WARM_TICKERS, *open_tickers))))
+
+
+async def _post_shutdown(application: Application) -> None:
+    await close_http_client()
+
+
 def main() -> None:
     init_db()
 
-    request = HTTPXRequest(connect_timeout=60.0, read_timeout=60.0)
-    application = Application.builder().token(TELEGRAM_TOKEN).request(request).build()
-
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("setmodel", setmodel))
-    application.add_handler(CommandHandler("scan", scan))
-    application.add_handler(CommandHandler("sentiment", sentiment))
-    application.add_handler(CommandHandler("manage", manage))
-    application.add_handler(CommandHandler("manageid", manage_by_id))
-    application.add_handler(CommandHandler("positions", positions))
-    application.add_handler(CommandHandler("open", open_trade))
-    application.add_handler(CommandHandler("edit", edit_trade))
-    
-    # Add the photo handler
-    application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
-
-    # NEW: Add the text listener for confirmations
-    # filters.TEXT & ~filters.COMMAND ensures we don't block commands like /start
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, confirm_trade))
+    request = HTTPXRequest(
+        connect_timeout=10.0,
+        read_timeout=60.0,
+        write_timeout=30.0,
+        pool_timeout=20.0,
+        connection_pool_size=64,
+        http_version="2",
+    )
+    # getUpdates long-polls on its own pool so it never waits behind replies.
+    updates_request = HTTPXRequest(connection_pool_size=8, pool_timeout=20.0)
+    application = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .request(request)
+        .get_updates_request(updates_request)
+        .post_init(_post_init)
+        .post_shutdown(_post_shutdown)
+        .build()
+    )
+
+    register_all(application)
 
     # DISABLED: Scheduled weekday market scans (Eastern Time)
     # These 3x daily telegram jobs have been disabled per user request.
@@ -73,9 +85,9 @@ def main() -> None:
     if test_offset:
         try:
             minutes = int(test_offset)
-            now_est = datetime.now(EST) + timedelta(minutes=minutes)
-            test_time = now_est.time().replace(microsecond=0)
-            today = datetime.now(EST).weekday()
+            now_est = datetime.now(EST)
+            today = now_est.weekday()
+            test_time = (now_est + timedelta(minutes=minutes)).time().replace(microsecond=0)
             application.job_queue.run_daily(
                 scheduled_market_scan,
                 test_time,
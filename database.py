@@ -1,15 +1,56 @@
 import logging
 import sqlite3
+import threading
+import time
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+DB_PATH = 'trades.db'
 
-def init_db() -> None:
-    """Initialize the trades database and backfill schema additions."""
-    conn = sqlite3.connect('trades.db')
-    c = conn.cursor()
+# One connection for the life of the process instead of connect/close per
+# query. Handlers call in from worker threads, so access is serialized.
+_conn: Optional[sqlite3.Connection] = None
+_lock = threading.RLock()
+
+# Separate read-only connection for the hot trade lookups. Under WAL a reader
+# works from its own snapshot, so these never queue behind _lock and a write.
+_ro_conn: Optional[sqlite3.Connection] = None
+_read_lock = threading.Lock()
+
+
+def _get_conn() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        # cached_statements sized well above the handful of distinct statements used here.
+        _conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=128)
+        # WAL lets readers proceed while a write is in progress; NORMAL skips
+        # the fsync on every commit, which WAL makes safe against corruption.
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        # ~20 MB page cache (negative = KiB) so hot pages stay resident between queries,
+        # and sorts/temp indexes built in memory rather than in temp files.
+        _conn.execute("PRAGMA cache_size=-20000")
+        _conn.execute("PRAGMA temp_store=MEMORY")
+        # Rows are handed out as-is: sqlite3.Row supports row["col"] without a per-row dict copy.
+        _conn.row_factory = sqlite3.Row
+    return _conn
+
+
+def _get_ro_conn() -> sqlite3.Connection:
+    """Read-only connection; call with _read_lock held. The database must already exist (init_db)."""
+    global _ro_conn
+    if _ro_conn is None:
+        _ro_conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, check_same_thread=False, cached_statements=128)
+        _ro_conn.execute("PRAGMA cache_size=-20000")
+        _ro_conn.execute("PRAGMA temp_store=MEMORY")
+        _ro_conn.row_factory = sqlite3.Row
+    return _ro_conn
+
+
+def _migrate_v1(c: sqlite3.Cursor) -> None:
+    """Baseline schema; also backfills columns on databases created before versioning."""
     c.execute(
         '''CREATE TABLE IF NOT EXISTS trades
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -41,76 +82,299 @@ def init_db() -> None:
         """CREATE INDEX IF NOT EXISTS idx_trades_chat_status
                  ON trades (chat_id, status)"""
     )
+    # Serves "latest trade for this ticker" lookups without a sort step.
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS idx_trades_chat_ticker_id
+                 ON trades (chat_id, ticker, id DESC)"""
+    )
 
-    conn.commit()
-    conn.close()
+    c.execute(
+        '''CREATE TABLE IF NOT EXISTS responses
+                 (key TEXT PRIMARY KEY,
+                  model TEXT,
+                  content TEXT,
+                  citations TEXT,
+                  created REAL)'''
+    )
 
 
-def row_to_dict(row: sqlite3.Row) -> Dict:
-    d = dict(row)
-    # Ensure all expected keys are present, even if columns are added later
-    d.setdefault("long_strike", None)
-    return d
+def _migrate_v2(c: sqlite3.Cursor) -> None:
+    """Trade lookups filter on status and sort by id DESC; index all of it so no sort step is needed."""
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS idx_trades_chat_ticker_status_id
+                 ON trades (chat_id, ticker, status, id DESC)"""
+    )
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS idx_trades_chat_status_id
+                 ON trades (chat_id, status, id DESC)"""
+    )
+    # Superseded: each is a prefix of (or unused next to) the indexes above.
+    c.execute("DROP INDEX IF EXISTS idx_trades_chat_ticker_status")
+    c.execute("DROP INDEX IF EXISTS idx_trades_chat_status")
+    c.execute("DROP INDEX IF EXISTS idx_trades_chat_ticker_id")
+    c.execute("ANALYZE trades")
 
 
-def get_open_positions(chat_id: int, ticker: Optional[str] = None) -> List[Dict]:
-    conn = sqlite3.connect('trades.db')
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    if ticker:
-        c.execute(
-            """SELECT *
-                     FROM trades
-                     WHERE ticker=? AND chat_id=? AND status='OPEN'
-                     ORDER BY id DESC""",
-            (ticker, chat_id),
-        )
-    else:
-        c.execute(
-            """SELECT *
-                     FROM trades
-                     WHERE chat_id=? AND status='OPEN'
-                     ORDER BY id DESC""",
-            (chat_id,),
-        )
-    rows = [row_to_dict(r) for r in c.fetchall()]
-    conn.close()
-    return rows
+def _migrate_v3(c: sqlite3.Cursor) -> None:
+    """
+    Every hot query filters on status='OPEN', so index only open trades. The
+    per-chat index carries all selected columns, letting /positions be answered
+    from the index alone.
+    """
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS idx_trades_open_cover
+                 ON trades (chat_id, id DESC, ticker, type, strike, long_strike, entry_price, date, expiry, status, closed_date)
+                 WHERE status='OPEN'"""
+    )
+    c.execute(
+        """CREATE INDEX IF NOT EXISTS idx_trades_open_ticker
+                 ON trades (chat_id, ticker, id DESC)
+                 WHERE status='OPEN'"""
+    )
+    c.execute("DROP INDEX IF EXISTS idx_trades_chat_ticker_status_id")
+    c.execute("DROP INDEX IF EXISTS idx_trades_chat_status_id")
+    c.execute("ANALYZE trades")
 
 
-def get_trade_by_id(trade_id: int, chat_id: int) -> Optional[Dict]:
-    conn = sqlite3.connect('trades.db')
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
+def _migrate_v4(c: sqlite3.Cursor) -> None:
+    """
+    Store strikes and premiums as INTEGER cents rather than REAL: exact values,
+    and smaller rows (SQLite packs small integers into 1-3 bytes vs 8 for a float).
+    SQLite can't retype a column in place, so the table is rebuilt.
+    """
+    # Left behind by a v4 attempt that ran before migrations were transactional.
+    c.execute("DROP TABLE IF EXISTS trades_new")
+    c.execute(
+        '''CREATE TABLE trades_new
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  chat_id INTEGER,
+                  ticker TEXT,
+                  type TEXT,
+                  strike_cents INTEGER,
+                  long_strike_cents INTEGER,
+                  entry_price_cents INTEGER,
+                  date TEXT,
+                  expiry TEXT,
+                  status TEXT DEFAULT 'OPEN',
+                  closed_date TEXT)'''
+    )
+    # ROUND before the cast: 0.29 * 100 is 28.999..., which a bare CAST would truncate.
+    c.execute(
+        """INSERT INTO trades_new
+                 (id, chat_id, ticker, type, strike_cents, long_strike_cents, entry_price_cents,
+                  date, expiry, status, closed_date)
+                 SELECT id, chat_id, ticker, type,
+                        CAST(ROUND(strike * 100) AS INTEGER),
+                        CAST(ROUND(long_strike * 100) AS INTEGER),
+                        CAST(ROUND(entry_price * 100) AS INTEGER),
+                        date, expiry, status, closed_date
+                 FROM trades"""
+    )
+    c.execute("DROP TABLE trades")
+    c.execute("ALTER TABLE trades_new RENAME TO trades")
+    c.execute(
+        """CREATE INDEX idx_trades_open_cover
+                 ON trades (chat_id, id DESC, ticker, type, strike_cents, long_strike_cents, entry_price_cents,
+                            date, expiry, status, closed_date)
+                 WHERE status='OPEN'"""
+    )
     c.execute(
-        """SELECT *
-                 FROM trades
-                 WHERE id=? AND chat_id=? AND status='OPEN'
-                 LIMIT 1""",
-        (trade_id, chat_id),
+        """CREATE INDEX idx_trades_open_ticker
+                 ON trades (chat_id, ticker, id DESC)
+                 WHERE status='OPEN'"""
     )
-    row = c.fetchone()
-    conn.close()
-    return row_to_dict(row) if row else None
+    c.execute("ANALYZE trades")
+
+
+# Schema migrations in order; PRAGMA user_version records how many have run.
+_MIGRATIONS = (_migrate_v1, _migrate_v2, _migrate_v3, _migrate_v4)
+
+
+SCHEMA_VERSION = len(_MIGRATIONS)
+
+# Current schema in one script, for brand-new databases: replaying v1..v4 would
+# create the REAL-column table only to rebuild it. Keep in step with _MIGRATIONS.
+_SCHEMA_DDL = f"""
+BEGIN;
+CREATE TABLE trades
+         (id INTEGER PRIMARY KEY AUTOINCREMENT,
+          chat_id INTEGER,
+          ticker TEXT,
+          type TEXT,
+          strike_cents INTEGER,
+          long_strike_cents INTEGER,
+          entry_price_cents INTEGER,
+          date TEXT,
+          expiry TEXT,
+          status TEXT DEFAULT 'OPEN',
+          closed_date TEXT);
+CREATE INDEX idx_trades_open_cover
+         ON trades (chat_id, id DESC, ticker, type, strike_cents, long_strike_cents, entry_price_cents,
+                    date, expiry, status, closed_date)
+         WHERE status='OPEN';
+CREATE INDEX idx_trades_open_ticker
+         ON trades (chat_id, ticker, id DESC)
+         WHERE status='OPEN';
+CREATE TABLE IF NOT EXISTS responses
+         (key TEXT PRIMARY KEY,
+          model TEXT,
+          content TEXT,
+          citations TEXT,
+          created REAL);
+PRAGMA user_version={SCHEMA_VERSION};
+COMMIT;
+"""
+
+
+def init_db() -> None:
+    """Create or upgrade the trades database. Only migrations newer than user_version run."""
+    with _lock:
+        conn = _get_conn()
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+
+        # Unversioned files that already have a trades table predate user_version
+        # and go through the migrations; an empty file gets the schema directly.
+        if version == 0 and conn.execute("SELECT 1 FROM sqlite_master WHERE name='trades'").fetchone() is None:
+            try:
+                conn.executescript(_SCHEMA_DDL)
+            except sqlite3.Error:
+                # executescript leaves a failed BEGIN ... COMMIT block open.
+                conn.rollback()
+                raise
+            logger.info("Created trades database at schema version %d", SCHEMA_VERSION)
+            return
+
+        c = conn.cursor()
+        for number, migrate in enumerate(_MIGRATIONS[version:], version + 1):
+            # Explicit BEGIN: the sqlite3 module only opens transactions implicitly
+            # before DML, so DDL would otherwise autocommit statement by statement and
+            # a failure could leave a half-applied migration behind.
+            c.execute("BEGIN")
+            try:
+                migrate(c)
+                c.execute(f"PRAGMA user_version={number}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            logger.info("Migrated trades database to schema version %d", number)
 
 
-def get_all_open_trades() -> List[Dict]:
+# Short-lived cache of get_open_positions results: chat_id -> {ticker or None: (fetched_at, rows)}.
+# Writes through this module drop the chat's entries, so the TTL only bounds staleness
+# from changes made outside the bot process.
+POSITIONS_CACHE_TTL = 30.0
+POSITIONS_CACHE_MAX = 512
+_POSITIONS_CACHE: Dict[int, Dict[Optional[str], Tuple[float, List[sqlite3.Row]]]] = {}
+
+# Money columns are stored as integer cents: public field name -> stored column.
+_CENTS_COLUMNS = {"strike": "strike_cents", "long_strike": "long_strike_cents", "entry_price": "entry_price_cents"}
+
+# Columns handed to callers, in a fixed order; cents are converted back to dollars here
+# so rows keep the same field names and float values as before.
+_COLS = (
+    "id", "chat_id", "ticker", "type",
+    "strike_cents / 100.0 AS strike",
+    "long_strike_cents / 100.0 AS long_strike",
+    "entry_price_cents / 100.0 AS entry_price",
+    "date", "expiry", "status", "closed_date",
+)
+_SELECT_TRADE = f"SELECT {', '.join(_COLS)} FROM trades"
+
+# Hot queries as module constants: identical SQL text on every call is what
+# keys the connection's prepared-statement cache.
+SQL_OPEN_BY_TICKER = f"{_SELECT_TRADE} WHERE ticker=? AND chat_id=? AND status='OPEN' ORDER BY id DESC"
+SQL_OPEN_BY_CHAT = f"{_SELECT_TRADE} WHERE chat_id=? AND status='OPEN' ORDER BY id DESC"
+SQL_OPEN_BY_ID = f"{_SELECT_TRADE} WHERE id=? AND chat_id=? AND status='OPEN' LIMIT 1"
+SQL_OPEN_ALL = f"{_SELECT_TRADE} WHERE status='OPEN' ORDER BY id DESC"
+
+
+def get_open_positions(chat_id: int, ticker: Optional[str] = None) -> List[sqlite3.Row]:
+    with _read_lock:
+        by_ticker = _POSITIONS_CACHE.get(chat_id)
+        hit = by_ticker.get(ticker) if by_ticker else None
+        now = time.monotonic()
+        if hit and now - hit[0] < POSITIONS_CACHE_TTL:
+            return list(hit[1])
+
+        conn = _get_ro_conn()
+        if ticker:
+            rows = conn.execute(SQL_OPEN_BY_TICKER, (ticker, chat_id)).fetchall()
+        else:
+            rows = conn.execute(SQL_OPEN_BY_CHAT, (chat_id,)).fetchall()
+
+        if by_ticker is None:
+            if len(_POSITIONS_CACHE) >= POSITIONS_CACHE_MAX:
+                _POSITIONS_CACHE.pop(next(iter(_POSITIONS_CACHE)))
+            by_ticker = _POSITIONS_CACHE[chat_id] = {}
+        by_ticker[ticker] = (now, rows)
+        # Callers get their own list; the rows themselves are immutable.
+        return list(rows)
+
+
+def _invalidate_positions(chat_id: int) -> None:
+    # Called after the write commits. Taking _read_lock means a lookup that read
+    # the old rows has finished storing them, so they're dropped here rather than
+    # lingering in the cache.
+    with _read_lock:
+        _POSITIONS_CACHE.pop(chat_id, None)
+
+
+def get_trade_by_id(trade_id: int, chat_id: int) -> Optional[sqlite3.Row]:
+    with _read_lock:
+        return _get_ro_conn().execute(SQL_OPEN_BY_ID, (trade_id, chat_id)).fetchone()
+
+
+def get_all_open_trades() -> List[sqlite3.Row]:
     """
     Retrieve all open trades across all users.
     Used by scheduled jobs to broadcast manage checks.
     """
-    conn = sqlite3.connect('trades.db')
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
-    c.execute(
-        """SELECT *
-                 FROM trades
-                 WHERE status='OPEN'
-                 ORDER BY id DESC"""
+    with _read_lock:
+        return _get_ro_conn().execute(SQL_OPEN_ALL).fetchall()
+
+
+def get_open_tickers() -> List[str]:
+    """Distinct tickers with at least one open trade."""
+    with _read_lock:
+        rows = _get_ro_conn().execute("SELECT DISTINCT ticker FROM trades WHERE status='OPEN'").fetchall()
+    return [r[0] for r in rows]
+
+
+_INSERT_TRADE = """INSERT INTO trades (chat_id, ticker, type, strike_cents, long_strike_cents, entry_price_cents, date, expiry, status, closed_date)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'OPEN', NULL)"""
+
+
+def to_cents(value: Any) -> int:
+    """Dollar amount (number or numeric string) -> integer cents."""
+    return int(round(float(value) * 100))
+
+
+def trade_row(
+    chat_id: int,
+    ticker: str,
+    t_type: str,
+    strike: float,
+    premium: float,
+    expiry: str,
+    long_strike: Optional[float] = None,
+    open_date: Optional[str] = None,
+) -> Tuple:
+    """Normalize one trade into the parameter tuple _INSERT_TRADE expects."""
+    # Use provided open_date or default to now
+    trade_date = open_date if open_date else datetime.now().strftime('%Y-%m-%d')
+    return (
+        chat_id,
+        ticker.upper(),
+        t_type.upper(),
+        to_cents(strike),
+        to_cents(long_strike) if long_strike else None,
+        to_cents(premium),
+        trade_date,
+        expiry,
     )
-    rows = [row_to_dict(r) for r in c.fetchall()]
-    conn.close()
-    return rows
 
 
 def open_trade(
@@ -124,31 +388,29 @@ def open_trade(
     open_date: Optional[str] = None,
 ) -> int:
     """Insert a new open trade and return its id."""
-    conn = sqlite3.connect('trades.db')
-    c = conn.cursor()
+    row = trade_row(chat_id, ticker, t_type, strike, premium, expiry, long_strike, open_date)
+    with _lock:
+        conn = _get_conn()
+        with conn:
+            trade_id = conn.execute(_INSERT_TRADE, row).lastrowid
+        _invalidate_positions(chat_id)
+    logger.info("Successfully opened trade_id %s for %s (%s)", trade_id, ticker, t_type)
+    return trade_id
 
-    # Use provided open_date or default to now
-    trade_date = open_date if open_date else datetime.now().strftime('%Y-%m-%d')
 
-    c.execute(
-        """INSERT INTO trades (chat_id, ticker, type, strike, long_strike, entry_price, date, expiry, status, closed_date)
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'OPEN', NULL)""",
-        (
-            chat_id,
-            ticker.upper(),
-            t_type.upper(),
-            float(strike),
-            float(long_strike) if long_strike else None,
-            float(premium),
-            trade_date,
-            expiry,
-        ),
-    )
-    conn.commit()
-    trade_id = c.lastrowid
-    conn.close()
-    logger.info(f"Successfully opened trade_id {trade_id} for {ticker} ({t_type})")
-    return trade_id
+def open_trades_bulk(rows: List[Tuple]) -> int:
+    """
+    Insert several trades (each built with trade_row) in a single transaction,
+    so the batch costs one commit instead of one per trade. Returns the row count.
+    """
+    with _lock:
+        conn = _get_conn()
+        with conn:
+            conn.executemany(_INSERT_TRADE, rows)
+        for chat_id in {row[0] for row in rows}:
+            _invalidate_positions(chat_id)
+    logger.info("Successfully opened %d trades", len(rows))
+    return len(rows)
 
 
 def update_trade_field(trade_id: int, chat_id: int, field: str, value: Any) -> bool:
@@ -157,22 +419,60 @@ def update_trade_field(trade_id: int, chat_id: int, field: str, value: Any) -> b
     MUST validate that the trade belongs to chat_id.
     Returns True if update was successful.
     """
-    conn = sqlite3.connect('trades.db')
-    c = conn.cursor()
-
-    # First, verify the trade belongs to the user
-    c.execute("SELECT id FROM trades WHERE id=? AND chat_id=?", (trade_id, chat_id))
-    if c.fetchone() is None:
-        conn.close()
-        return False
-
-    try:
-        c.execute(f"UPDATE trades SET {field}=? WHERE id=?", (value, trade_id))
-        conn.commit()
-        conn.close()
-        logger.info(f"Successfully updated {field} for trade_id {trade_id}")
-        return True
-    except sqlite3.Error as e:
-        logger.error(f"Failed to update trade {trade_id}: {e}")
-        conn.close()
-        return False
+    with _lock:
+        conn = _get_conn()
+        c = conn.cursor()
+
+        # First, verify the trade belongs to the user
+        c.execute("SELECT id FROM trades WHERE id=? AND chat_id=?", (trade_id, chat_id))
+        if c.fetchone() is None:
+            return False
+
+        if field in _CENTS_COLUMNS:
+            field, value = _CENTS_COLUMNS[field], to_cents(value)
+
+        try:
+            c.execute(f"UPDATE trades SET {field}=? WHERE id=?", (value, trade_id))
+            conn.commit()
+            _invalidate_positions(chat_id)
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error("Failed to update trade %s: %s", trade_id, e)
+            return False
+
+    logger.info("Successfully updated %s for trade_id %s", field, trade_id)
+    return True
+
+
+# Stored responses older than this are deleted. Must cover the longest cache_ttl
+# callers pass (handlers.SCAN_CACHE_TTL, 600s).
+RESPONSE_MAX_AGE = 3600
+
+
+def get_cached_response(key: str, max_age: float) -> Optional[Tuple[float, Tuple[str, Tuple[str, ...]]]]:
+    """Return (created, (content, citations)) for a stored AI response younger than max_age seconds."""
+    with _lock:
+        c = _get_conn().cursor()
+        c.execute(
+            "SELECT created, content, citations FROM responses WHERE key=? AND created > ?",
+            (key, time.time() - max_age),
+        )
+        row = c.fetchone()
+    if row is None:
+        return None
+    created, content, citations = row
+    return created, (content, tuple(citations.split("\n")) if citations else ())
+
+
+def store_cached_response(key: str, model: str, content: str, citations: Tuple[str, ...]) -> None:
+    """Insert or refresh a stored AI response, dropping rows too old for any reader."""
+    now = time.time()
+    with _lock:
+        conn = _get_conn()
+        with conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO responses (key, model, content, citations, created)
+                         VALUES (?, ?, ?, ?, ?)""",
+                (key, model, content, "\n".join(citations), now),
+            )
+            conn.execute("DELETE FROM responses WHERE created < ?", (now - RESPONSE_MAX_AGE,))
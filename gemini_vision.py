@@ -1,13 +1,52 @@
-from google import genai
+from google.genai import types
 import logging
-import json
 import os
-from PIL import Image
-import io
+
+import orjson
+
+from ai_engine import gemini_client
 
 logger = logging.getLogger(__name__)
 
-def analyze_trade_screenshot(image_bytes: bytes) -> dict:
+# Leading magic bytes -> MIME type for the formats Telegram delivers.
+_IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF8', 'image/gif'),
+)
+
+
+# Shape of the extraction result; Gemini's JSON mode is constrained to it.
+_TRADE_SCHEMA = types.Schema(
+    type=types.Type.OBJECT,
+    properties={
+        "ticker": types.Schema(type=types.Type.STRING),
+        "type": types.Schema(type=types.Type.STRING, enum=["CSP", "CC", "BPS", "CCS"]),
+        "short_strike": types.Schema(type=types.Type.NUMBER),
+        "long_strike": types.Schema(type=types.Type.NUMBER, nullable=True),
+        "price": types.Schema(type=types.Type.NUMBER),
+        "expiry": types.Schema(type=types.Type.STRING),
+        "open_date": types.Schema(type=types.Type.STRING, nullable=True),
+    },
+    required=["ticker", "type", "short_strike", "price", "expiry"],
+)
+_TRADE_CONFIG = types.GenerateContentConfig(
+    response_mime_type="application/json",
+    response_schema=_TRADE_SCHEMA,
+)
+
+
+def _image_mime_type(image_bytes: bytes) -> str:
+    for signature, mime_type in _IMAGE_SIGNATURES:
+        if image_bytes.startswith(signature):
+            return mime_type
+    if image_bytes[:4] == b'RIFF' and image_bytes[8:12] == b'WEBP':
+        return 'image/webp'
+    # Telegram re-encodes photos as JPEG, so that's the safe default.
+    return 'image/jpeg'
+
+
+async def analyze_trade_screenshot(image_bytes: bytes) -> dict:
     """
     Analyzes a trade screenshot image and extracts trade details using Gemini.
 
@@ -18,16 +57,16 @@ def analyze_trade_screenshot(image_bytes: bytes) -> dict:
         A dictionary containing the extracted trade details.
     """
     try:
-        # Load the image from bytes
-        img = Image.open(io.BytesIO(image_bytes))
-        
-        # Initialize the new Client using the environment variable
+        # Send the encoded bytes as-is; decoding to a PIL image only for the SDK to re-encode it is wasted work.
+        image_part = types.Part.from_bytes(data=image_bytes, mime_type=_image_mime_type(image_bytes))
+
         api_key = os.getenv('GEMINI_API_KEY')
         if not api_key:
             logger.error("GEMINI_API_KEY not found in environment variables.")
             return {}
 
-        client = genai.Client(api_key=api_key)
+        # Shared with ai_engine, so screenshots reuse its client and connection pool.
+        client = gemini_client(api_key)
 
         prompt = """
         Analyze this trade screenshot. Return JSON with these keys:
@@ -40,19 +79,17 @@ def analyze_trade_screenshot(image_bytes: bytes) -> dict:
         * open_date: The date the trade was opened/filled (MM/DD/YYYY). Infer year if missing.
         """
 
-        # Call the model using the new Client syntax
-        response = client.models.generate_content(
+        # JSON mode: the reply is the bare object described by _TRADE_CONFIG, no fences to strip
+        # Native async client: the multi-second vision call doesn't hold the event loop or a worker thread.
+        response = await client.aio.models.generate_content(
             model='gemini-2.5-flash',
-            contents=[prompt, img]
+            contents=[prompt, image_part],
+            config=_TRADE_CONFIG,
         )
-        
-        # Clean the response to extract the JSON part
-        # Note: The new SDK response object also has a .text property
-        cleaned_response = response.text.strip().replace('```json', '').replace('```', '').strip()
-        
-        trade_details = json.loads(cleaned_response)
+
+        trade_details = orjson.loads(response.text)
         return trade_details
 
     except Exception as e:
-        logger.error(f"Error analyzing trade screenshot: {e}")
+        logger.error("Error analyzing trade screenshot: %s", e)
         return {}
@@ -1,25 +1,73 @@
-import io
+import asyncio
 import logging
-from datetime import datetime
-from typing import Dict, List
-import requests
+import re
+from datetime import date, datetime
+from typing import Awaitable, Dict, List, TypeVar
 from telegram import Update
 from telegram.constants import ChatAction
-from telegram.ext import CallbackContext
+from telegram.ext import Application, CallbackContext, CommandHandler, MessageHandler, filters
 
 from ai_engine import (
+    STREAMING_PROVIDERS,
+    append_sources,
     build_manage_prompt,
     build_ticker_sentiment_prompt,
     call_ai,
+    call_ai_stream,
     resolve_model,
     set_user_model,
 )
-from database import get_open_positions, get_trade_by_id, open_trade as open_trade_record, update_trade_field
-from market_data import derive_sectors_for_tickers, get_market_data, is_ticker_like, normalize_tickers
+from database import (
+    get_open_positions,
+    get_trade_by_id,
+    open_trade as open_trade_record,
+    open_trades_bulk,
+    trade_row,
+    update_trade_field,
+)
+from market_data import derive_sectors_for_tickers, fetch_market_data, is_ticker_like, normalize_ticker, normalize_tickers
 from gemini_vision import analyze_trade_screenshot
+from telegram_send import MAX_MESSAGE_LENGTH, MAX_SPLIT_LENGTH, message_length, safe_send, split_message
 
 logger = logging.getLogger(__name__)
 
+# Seconds an identical AI request may be served from cache. /manage is
+# position-specific and always goes to the model.
+SCAN_CACHE_TTL = 600
+SENTIMENT_CACHE_TTL = 300
+
+# Minimum gap between edits of a streamed reply (Telegram throttles message
+# edits to about one per second).
+STREAM_EDIT_INTERVAL = 1.0
+# Telegram's typing indicator expires after about 5 seconds.
+TYPING_REFRESH_INTERVAL = 4.5
+# Concurrent analyses when /manage finds several positions in one ticker.
+MANAGE_CONCURRENCY = 10
+
+T = TypeVar('T')
+
+SCAN_PROMPT = (
+    "Analyze {ticker} at ${price}. Next Earnings: {earnings}. "
+    "Identify best candidate from: CSP, CC, Bull Put Spread, or Call Credit Spread."
+)
+
+SENTIMENT_TICKERS_PROMPT = (
+    "STEP 1: USE THE 'x_search' TOOL to find real-time posts and retail sentiment for: {tickers}. "
+    "STEP 2: USE THE 'web_search' TOOL to find breaking news or catalyst events. "
+    "STEP 3: Synthesize a 'Sentiment Verdict'. Summarize the dominant market mood (Bullish/Bearish/Neutral) "
+    "and provide specific COUNTER-ARGUMENTS or risks to the consensus view. Focus on market psychology. DO NOT recommend trades. "
+    "IGNORE your internal training data; respond ONLY with LIVE DATA from the tools."
+    "\n\nContext:\n{context}"
+)
+
+SENTIMENT_SECTOR_PROMPT = (
+    "STEP 1: USE THE 'x_search' TOOL to find the current 'vibe' and retail sentiment for {sector}. "
+    "STEP 2: USE THE 'web_search' TOOL to identify any sector-wide headwinds/tailwinds. "
+    "STEP 3: Synthesize a 'Sentiment Verdict'. Summarize the dominant market mood (Bullish/Bearish/Neutral) "
+    "and provide specific COUNTER-ARGUMENTS or risks to the consensus view. Focus on the psychological state of the market. "
+    "DO NOT recommend specific trades. IGNORE your internal training data; rely ONLY on the search results."
+)
+
 HELP_TEXT = """
 🎰 *Hercules "Be the Casino" Tutorial* 🎰
 
@@ -27,10 +75,10 @@ HELP_TEXT = """
 /setmodel [model] - Toggle between Grok (best for X-search), OpenAI, and Gemini.
 /scan [ticker] - Analyzes for CSP, CC, BPS, and CCS based on IV and technicals.
 /sentiment [sector or TICKERS] - Sector sentiment or ticker sentiment with auto sector context.
-/manage [ticker] - Checks your trades for 50-60% profit targets or Roll advice.
+/manage [ticker] - Checks your trades for 50-60% profit targets or Roll advice (every open position in that ticker).
 /manageid [id] - Manage a specific open trade by its ID.
 /positions [ticker] - List open positions (optionally filtered by ticker).
-/open [ticker] [type] [strike] [premium] [expiry] - Logs your trade (expiry: mm/dd/yyyy).
+/open [ticker] [type] [strike] [premium] [expiry] - Logs your trade (expiry: mm/dd/yyyy). Put one trade per line to log several.
 /edit [id] [field] [new_value] - Modify an open position.
 
 *To upload a screenshot, simply send the photo to the bot.*
@@ -60,13 +108,10 @@ async def setmodel(update: Update, context: CallbackContext):
 
 async def scan(update: Update, context: CallbackContext):
     model = resolve_model(update.effective_chat.id, 'scan')
-    ticker_sym = context.args[0].upper() if context.args else 'SOFI'
-    data = get_market_data(ticker_sym)
-    prompt = (
-        f"Analyze {ticker_sym} at ${data['price']}. Next Earnings: {data['earnings']}. "
-        f"Identify best candidate from: CSP, CC, Bull Put Spread, or Call Credit Spread."
-    )
-    await handle_ai_request(update, context, model, prompt, task_type='speed')
+    ticker_sym = normalize_ticker(context.args[0]) if context.args else 'SOFI'
+    data = await fetch_market_data(ticker_sym)
+    prompt = SCAN_PROMPT.format_map({"ticker": ticker_sym, "price": data['price'], "earnings": data['earnings']})
+    await handle_ai_request(update, context, model, prompt, task_type='speed', cache_ttl=SCAN_CACHE_TTL)
 
 
 async def sentiment(update: Update, context: CallbackContext):
@@ -84,53 +129,62 @@ async def sentiment(update: Update, context: CallbackContext):
             tickers = candidate_tickers
 
     if tickers:
-        sector_map = derive_sectors_for_tickers(tickers)
+        # Order-independent, so "/sentiment SOFI PLTR" and "/sentiment PLTR SOFI" hit the same cache entry.
+        tickers = sorted(dict.fromkeys(tickers))
+        sector_map = await asyncio.to_thread(derive_sectors_for_tickers, tickers)
         base_context = build_ticker_sentiment_prompt(tickers, sector_map)
 
-        prompt = (
-            f"STEP 1: USE THE 'x_search' TOOL to find real-time posts and retail sentiment for: {', '.join(tickers)}. "
-            f"STEP 2: USE THE 'web_search' TOOL to find breaking news or catalyst events. "
-            f"STEP 3: Synthesize a 'Sentiment Verdict'. Summarize the dominant market mood (Bullish/Bearish/Neutral) "
-            f"and provide specific COUNTER-ARGUMENTS or risks to the consensus view. Focus on market psychology. DO NOT recommend trades. "
-            f"IGNORE your internal training data; respond ONLY with LIVE DATA from the tools."
-            f"\n\nContext:\n{base_context}"
-        )
+        prompt = SENTIMENT_TICKERS_PROMPT.format_map({"tickers": ', '.join(tickers), "context": base_context})
     else:
         sector = ' '.join(args) or 'tech stocks'
-        prompt = (
-            f"STEP 1: USE THE 'x_search' TOOL to find the current 'vibe' and retail sentiment for {sector}. "
-            f"STEP 2: USE THE 'web_search' TOOL to identify any sector-wide headwinds/tailwinds. "
-            f"STEP 3: Synthesize a 'Sentiment Verdict'. Summarize the dominant market mood (Bullish/Bearish/Neutral) "
-            f"and provide specific COUNTER-ARGUMENTS or risks to the consensus view. Focus on the psychological state of the market. "
-            f"DO NOT recommend specific trades. IGNORE your internal training data; rely ONLY on the search results."
-        )
-    await handle_ai_request(update, context, model, prompt, task_type='speed')
+        prompt = SENTIMENT_SECTOR_PROMPT.format_map({"sector": sector})
+    await handle_ai_request(update, context, model, prompt, task_type='speed', cache_ttl=SENTIMENT_CACHE_TTL)
 
 
 async def manage(update: Update, context: CallbackContext):
     model = resolve_model(update.effective_chat.id, 'manage')
-    ticker = context.args[0].upper() if context.args else None
+    ticker = normalize_ticker(context.args[0]) if context.args else None
     if not ticker:
         return await update.effective_message.reply_text("Usage: /manage [ticker]")
 
-    positions = get_open_positions(update.effective_chat.id, ticker)
+    positions = await asyncio.to_thread(get_open_positions, update.effective_chat.id, ticker)
     if not positions:
         return await update.effective_message.reply_text(f"No open positions for {ticker}.")
 
+    market = await fetch_market_data(ticker)
+
     if len(positions) > 1:
-        lines = [format_position_line(p) for p in positions]
-        message = (
-            f"⚠️ Multiple open positions found for {ticker}.\n"
-            f"Please select one using /manageid <id>:\n\n" + "\n".join(lines)
-        )
-        return await update.effective_message.reply_text(message)
+        return await manage_positions(update, context, model, positions, market)
 
-    trade = positions[0]
-    market = get_market_data(ticker)
-    prompt = build_manage_prompt(trade, market)
+    prompt = build_manage_prompt(positions[0], market)
     await handle_ai_request(update, context, model, prompt, task_type='reasoning')
 
 
+async def manage_positions(update: Update, context: CallbackContext, model: str, positions: List, market: Dict):
+    """Analyze several positions in one ticker concurrently and reply once per position."""
+    sem = asyncio.Semaphore(MANAGE_CONCURRENCY)
+
+    async def analyze(trade):
+        async with sem:
+            return await call_ai(model, build_manage_prompt(trade, market), task_type='reasoning')
+
+    results = await with_typing(
+        context,
+        update.effective_chat.id,
+        asyncio.gather(*(analyze(p) for p in positions), return_exceptions=True),
+    )
+
+    for trade, result in zip(positions, results):
+        header = f"📌 {format_position_line(trade)}"
+        if isinstance(result, Exception):
+            logger.error("Manage analysis failed for trade %s: %s", trade['id'], result)
+            await safe_send(lambda: update.effective_message.reply_text(f"{header}\n\n⚠️ Analysis failed: {result}"))
+            continue
+        content, citations = result
+        body = append_sources(content or "⚠️ AI returned no text (Check logs for tool output).", citations)
+        await reply_text_or_file(update, f"{header}\n\n{body}")
+
+
 async def manage_by_id(update: Update, context: CallbackContext):
     model = resolve_model(update.effective_chat.id, 'manageid')
     if not context.args:
@@ -140,31 +194,58 @@ async def manage_by_id(update: Update, context: CallbackContext):
     except ValueError:
         return await update.effective_message.reply_text("Trade id must be a number.")
 
-    trade = get_trade_by_id(trade_id, update.effective_chat.id)
+    trade = await asyncio.to_thread(get_trade_by_id, trade_id, update.effective_chat.id)
     if not trade:
         return await update.effective_message.reply_text("No open trade found with that ID for this chat.")
 
-    market = get_market_data(trade["ticker"])
+    market = await fetch_market_data(trade["ticker"])
     prompt = build_manage_prompt(trade, market)
     await handle_ai_request(update, context, model, prompt, task_type='reasoning')
 
 
 async def positions(update: Update, context: CallbackContext):
-    ticker_filter = context.args[0].upper() if context.args else None
-    trades = get_open_positions(update.effective_chat.id, ticker_filter)
+    ticker_filter = normalize_ticker(context.args[0]) if context.args else None
+    trades = await asyncio.to_thread(get_open_positions, update.effective_chat.id, ticker_filter)
     if not trades:
         msg = f"No open positions{f' for {ticker_filter}' if ticker_filter else ''}."
         return await update.effective_message.reply_text(msg)
 
     header = f"Open positions{f' for {ticker_filter}' if ticker_filter else ''}:"
-    lines = [format_position_line(t) for t in trades]
-    await update.effective_message.reply_text(f"{header}\n" + "\n".join(lines))
+    # One join over header and lines; str.join builds a list from a generator anyway.
+    await update.effective_message.reply_text("\n".join([header, *map(format_position_line, trades)]))
+
+
+# MM/DD/YYYY, leading zeros optional (as strptime's %m/%d accepted).
+_EXPIRY_RE = re.compile(r'(0?[1-9]|1[0-2])/(0?[1-9]|[12]\d|3[01])/(\d{4})')
+
+
+def is_valid_expiry(expiry: str) -> bool:
+    """Cheap regex reject first; date() then catches impossible days like 02/30."""
+    match = _EXPIRY_RE.fullmatch(expiry)
+    if not match:
+        return False
+    month, day, year = map(int, match.groups())
+    try:
+        date(year, month, day)
+    except ValueError:
+        return False
+    return True
 
 
 async def open_trade(update: Update, context: CallbackContext):
     """
     Command: /open [ticker] [type] [strike] [premium] [expiry]
+    Several trades can be logged at once, one per line after the command.
     """
+    lines = [line.split() for line in update.effective_message.text.splitlines()]
+    lines[0] = lines[0][1:]  # drop the /open command itself
+    lines = [tokens for tokens in lines if tokens]
+
+    # Only a batch when every line is a complete trade; anything else (e.g. one
+    # trade wrapped across two lines) goes through the single-trade path below.
+    if len(lines) > 1 and all(len(tokens) == 5 for tokens in lines):
+        return await open_trades_batch(update, lines)
+
     args = context.args
     arg_count = len(args)
 
@@ -181,12 +262,11 @@ async def open_trade(update: Update, context: CallbackContext):
     try:
         ticker, t_type, strike, premium, expiry = args
 
-        try:
-            datetime.strptime(expiry, '%m/%d/%Y')
-        except ValueError:
+        if not is_valid_expiry(expiry):
             return await update.effective_message.reply_text("❌ Date must be in MM/DD/YYYY format.")
 
-        open_trade_record(
+        await asyncio.to_thread(
+            open_trade_record,
             update.effective_chat.id,
             ticker,
             t_type,
@@ -203,6 +283,29 @@ async def open_trade(update: Update, context: CallbackContext):
         await update.effective_message.reply_text(f"⚠️ Database/System Error: {str(e)}")
 
 
+async def open_trades_batch(update: Update, lines: List[List[str]]):
+    """Validate every line of a multi-line /open (5 values each), then insert them all in one transaction."""
+    chat_id = update.effective_chat.id
+    rows = []
+    for number, tokens in enumerate(lines, 1):
+        ticker, t_type, strike, premium, expiry = tokens
+        try:
+            if not is_valid_expiry(expiry):
+                raise ValueError(expiry)
+            rows.append(trade_row(chat_id, ticker, t_type, strike, premium, expiry))
+        except ValueError:
+            return await update.effective_message.reply_text(
+                f"❌ Line {number}: strike/premium must be numbers and the date MM/DD/YYYY. Nothing was logged."
+            )
+
+    try:
+        count = await asyncio.to_thread(open_trades_bulk, rows)
+    except Exception as e:
+        return await update.effective_message.reply_text(f"⚠️ Database/System Error: {str(e)}")
+
+    summary = "\n".join(f"• {row[1]} {row[2]} expiring {row[7]}" for row in rows)
+    await update.effective_message.reply_text(f"✅ Business is open! Logged {count} trades:\n{summary}")
+
 async def handle_photo(update: Update, context: CallbackContext):
     """Handles photo uploads for trade analysis."""
     if not update.message.photo:
@@ -213,12 +316,10 @@ async def handle_photo(update: Update, context: CallbackContext):
     try:
         photo_file = await update.message.photo[-1].get_file()
         
-        # Use requests to download the file content
-        response = requests.get(photo_file.file_path)
-        response.raise_for_status()
-        image_bytes = response.content
+        # PTB downloads through the bot's own async connection pool (and handles local Bot API paths).
+        image_bytes = bytes(await photo_file.download_as_bytearray())
 
-        trade_details = analyze_trade_screenshot(image_bytes)
+        trade_details = await analyze_trade_screenshot(image_bytes)
 
         if not trade_details:
             return await update.effective_message.reply_text(
@@ -240,16 +341,16 @@ async def handle_photo(update: Update, context: CallbackContext):
         await update.effective_message.reply_text(confirmation_message) # We can add Yes/No buttons here later
 
     except Exception as e:
-        logger.error(f"Error handling photo: {e}")
+        logger.error("Error handling photo: %s", e)
         await update.effective_message.reply_text("An error occurred while processing the image.")
 
 
 def format_position_line(trade: Dict) -> str:
-    line = f"• ID {trade['id']} — {trade['ticker']} {trade['type']} {trade['strike']}"
-    if trade.get('long_strike'):
-        line += f"/{trade['long_strike']}"
-    line += f" exp {trade['expiry']} entry {trade['entry_price']}"
-    return line
+    long_leg = f"/{trade['long_strike']}" if trade['long_strike'] else ''
+    return (
+        f"• ID {trade['id']} — {trade['ticker']} {trade['type']} {trade['strike']}{long_leg}"
+        f" exp {trade['expiry']} entry {trade['entry_price']}"
+    )
 
 async def confirm_trade(update: Update, context: CallbackContext):
     """Captures text replies to confirm/save the trade."""
@@ -266,7 +367,8 @@ async def confirm_trade(update: Update, context: CallbackContext):
             # Clean price string just in case Gemini added a '$'
             price_raw = str(trade_details['price']).replace('$', '')
             
-            trade_id = open_trade_record(
+            trade_id = await asyncio.to_thread(
+                open_trade_record,
                 chat_id=update.effective_chat.id,
                 ticker=trade_details['ticker'],
                 t_type=trade_details['type'],
@@ -280,7 +382,7 @@ async def confirm_trade(update: Update, context: CallbackContext):
             await update.effective_message.reply_text(f"✅ **Trade Saved!** (ID: {trade_id})")
         
         except Exception as e:
-            logger.error(f"Save Error: {e}")
+            logger.error("Save Error: %s", e)
             await update.effective_message.reply_text(f"⚠️ Error saving trade: {e}")
         
         # 3. Clear memory so we don't save it twice
@@ -295,36 +397,121 @@ async def confirm_trade(update: Update, context: CallbackContext):
     else:
         await update.effective_message.reply_text("⚠️ Please reply **'Yes'** to save or **'No'** to cancel.")
 
-async def handle_ai_request(update: Update, context: CallbackContext, model: str, prompt: str, task_type: str = 'speed'):
+async def send_typing(context: CallbackContext, chat_id: int) -> None:
     try:
-        await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
+        await context.bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
     except Exception as e:
         logger.warning("Could not send typing action (harmless network issue): %s", e)
 
+
+async def with_typing(context: CallbackContext, chat_id: int, coro: Awaitable[T]) -> T:
+    """
+    Await coro while showing a typing indicator. Telegram clears the indicator
+    after ~5s, so it is re-sent only while the call is still running.
+    """
+    task = asyncio.ensure_future(coro)
     try:
-        result, citations = await call_ai(model, prompt, task_type=task_type)
+        while True:
+            await send_typing(context, chat_id)
+            done, _ = await asyncio.wait({task}, timeout=TYPING_REFRESH_INTERVAL)
+            if done:
+                return task.result()
+    finally:
+        # If the handler itself is cancelled, don't leave the call running unobserved.
+        task.cancel()
+
+
+async def handle_ai_request(
+    update: Update,
+    context: CallbackContext,
+    model: str,
+    prompt: str,
+    task_type: str = 'speed',
+    cache_ttl: float = 0,
+):
+    chat_id = update.effective_chat.id
+
+    if model in STREAMING_PROVIDERS:
+        # The placeholder message shows progress, so one typing action is enough, and it
+        # goes out alongside the request rather than adding a round trip before it.
+        context.application.create_task(send_typing(context, chat_id))
+        return await stream_ai_reply(update, model, prompt, task_type=task_type, cache_ttl=cache_ttl)
+
+    try:
+        result, citations = await with_typing(
+            context, chat_id, call_ai(model, prompt, task_type=task_type, cache_ttl=cache_ttl)
+        )
 
         if not result:
             result = "⚠️ AI returned no text (Check logs for tool output)."
 
-        if citations:
-            deduped = []
-            for url in citations:
-                if url and url not in deduped:
-                    deduped.append(url)
-            if deduped:
-                sources_block = "\n".join(f"- {url}" for url in deduped)
-                result = f"{result}\n\nSources:\n{sources_block}"
-
-        if len(result) > 4000:
-            buffer = io.BytesIO(result.encode('utf-8'))
-            buffer.name = 'response.txt'
-            await update.effective_message.reply_document(document=buffer, caption='Response is long — sent as file.')
-        else:
-            await update.effective_message.reply_text(result)
+        await reply_text_or_file(update, append_sources(result, citations))
     except Exception as e:
         logger.error("Bot Reply Error: %s", e)
-        await update.effective_message.reply_text(f"⚠️ System Error: {str(e)}")
+        await safe_send(lambda: update.effective_message.reply_text(f"⚠️ System Error: {str(e)}"))
+
+
+async def reply_text_or_file(update: Update, text: str) -> None:
+    """Reply inline, split across a few messages, or as a text file when very long."""
+    length = message_length(text)
+    if length <= MAX_MESSAGE_LENGTH:
+        await safe_send(lambda: update.effective_message.reply_text(text))
+    elif length <= MAX_SPLIT_LENGTH:
+        for part in split_message(text):
+            await safe_send(lambda part=part: update.effective_message.reply_text(part))
+    else:
+        # PTB accepts raw bytes plus a filename, so skip the BytesIO wrapper.
+        await safe_send(lambda: update.effective_message.reply_document(
+            document=text.encode('utf-8'), filename='response.txt', caption='Response is long — sent as file.'
+        ))
+
+
+async def stream_ai_reply(update: Update, model: str, prompt: str, task_type: str = 'speed', cache_ttl: float = 0):
+    """Send a placeholder and edit it in place as response chunks arrive."""
+    loop = asyncio.get_running_loop()
+    parts: List[str] = []
+    shown = ""
+    message = None
+
+    try:
+        message = await safe_send(lambda: update.effective_message.reply_text("⏳ Thinking..."))
+        last_edit = loop.time()
+
+        async for chunk in call_ai_stream(model, prompt, task_type=task_type, cache_ttl=cache_ttl):
+            parts.append(chunk)
+            if loop.time() - last_edit < STREAM_EDIT_INTERVAL:
+                continue
+            text = "".join(parts).strip()
+            if text and text != shown and message_length(text) <= MAX_MESSAGE_LENGTH:
+                await safe_send(lambda: message.edit_text(text))
+                shown = text
+                last_edit = loop.time()
+
+        result = "".join(parts).strip() or "⚠️ AI returned no text (Check logs for tool output)."
+
+        length = message_length(result)
+        if length > MAX_SPLIT_LENGTH:
+            await safe_send(lambda: message.edit_text('Response is long — sent as file.'))
+            await safe_send(lambda: update.effective_message.reply_document(document=result.encode('utf-8'), filename='response.txt'))
+        elif length > MAX_MESSAGE_LENGTH:
+            # First part replaces the placeholder; the rest follow as new messages.
+            first, *rest = split_message(result)
+            if first != shown:
+                await safe_send(lambda: message.edit_text(first))
+            for part in rest:
+                await safe_send(lambda part=part: update.effective_message.reply_text(part))
+        elif result != shown:
+            await safe_send(lambda: message.edit_text(result))
+    except Exception as e:
+        logger.error("Bot Reply Error: %s", e)
+        error_text = f"⚠️ System Error: {str(e)}"
+        if message is not None:
+            # Replace the placeholder rather than leaving it stuck on "Thinking...".
+            try:
+                return await safe_send(lambda: message.edit_text(error_text))
+            except Exception as edit_error:
+                logger.warning("Could not edit placeholder with error: %s", edit_error)
+        await safe_send(lambda: update.effective_message.reply_text(error_text))
 
 
 async def edit_trade(update: Update, context: CallbackContext):
@@ -367,13 +554,13 @@ async def edit_trade(update: Update, context: CallbackContext):
         except ValueError:
             return await update.effective_message.reply_text("Date must be in YYYY-MM-DD format.")
 
-    trade_before = get_trade_by_id(trade_id, chat_id)
+    trade_before = await asyncio.to_thread(get_trade_by_id, trade_id, chat_id)
     if not trade_before:
         return await update.effective_message.reply_text(f"Trade ID {trade_id} not found.")
 
     old_value = trade_before[db_field]
 
-    success = update_trade_field(trade_id, chat_id, db_field, new_value)
+    success = await asyncio.to_thread(update_trade_field, trade_id, chat_id, db_field, new_value)
 
     if success:
         await update.effective_message.reply_text(
@@ -381,3 +568,24 @@ async def edit_trade(update: Update, context: CallbackContext):
         )
     else:
         await update.effective_message.reply_text(f"⚠️ Failed to update trade {trade_id}.")
+
+
+def register_all(application: Application) -> None:
+    """Register every command and message handler on the application."""
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("setmodel", setmodel))
+    application.add_handler(CommandHandler("scan", scan))
+    application.add_handler(CommandHandler("sentiment", sentiment))
+    application.add_handler(CommandHandler("manage", manage))
+    application.add_handler(CommandHandler("manageid", manage_by_id))
+    application.add_handler(CommandHandler("positions", positions))
+    application.add_handler(CommandHandler("open", open_trade))
+    application.add_handler(CommandHandler("edit", edit_trade))
+
+    # Add the photo handler
+    application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
+
+    # NEW: Add the text listener for confirmations
+    # filters.TEXT & ~filters.COMMAND ensures we don't block commands like /start
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, confirm_trade))
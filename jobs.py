@@ -1,65 +1,124 @@
 import asyncio
 import logging
-from typing import Iterable
+import sqlite3
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+from zoneinfo import ZoneInfo
 
-import pytz
 from telegram.ext import CallbackContext
 
 from ai_engine import build_manage_prompt, call_ai, resolve_model
 from database import get_all_open_trades
-from market_data import get_market_data
+from market_data import fetch_market_data
+from telegram_send import MAX_SPLIT_LENGTH, message_length, safe_send, split_message
 
 logger = logging.getLogger(__name__)
 
 # Eastern time is required for market-aligned scheduling
-EST = pytz.timezone("US/Eastern")
+EST = ZoneInfo("America/New_York")
+
+
+# Upper bound on concurrent trade analyses per scan, and per-trade timeout.
+SCAN_CONCURRENCY = 8
+SCAN_TRADE_TIMEOUT = 120
+# Concurrent outbound digests (one per chat); safe_send enforces the global rate limit.
+SEND_CONCURRENCY = 25
+
+
+async def _send_to_chat(context: CallbackContext, chat_id: int, text: str, sem: asyncio.Semaphore) -> None:
+    """Deliver one chat's digest; failures are logged per recipient instead of raised."""
+    async with sem:
+        try:
+            # FIX APPLIED: Removed parse_mode="Markdown"
+            # This ensures the message is delivered reliably as plain text,
+            # avoiding crashes if the AI generates special characters (like underscores).
+            if message_length(text) <= MAX_SPLIT_LENGTH:
+                for part in split_message(text):
+                    await safe_send(lambda part=part: context.bot.send_message(chat_id=chat_id, text=part))
+            else:
+                await safe_send(lambda: context.bot.send_document(
+                    chat_id=chat_id, document=text.encode("utf-8"), filename="scheduled_check.txt",
+                    caption="🔔 Scheduled Check — sent as file.",
+                ))
+        except Exception as exc:  # noqa: BLE001
+            logger.error("Failed to notify chat %s: %s", chat_id, exc)
+
+
+async def _analyze_trade(trade: sqlite3.Row, model: str, index: int, total: int, sem: asyncio.Semaphore) -> str:
+    """Run the management analysis for one open trade and return the model's reply."""
+    async with sem:
+        # Log exactly which trade is being processed
+        logger.info("Processing %d/%d: Trade ID %s (%s)", index, total, trade["id"], trade["ticker"])
+
+        market = await fetch_market_data(trade["ticker"])
+        prompt = build_manage_prompt(trade, market)
+
+        response, _ = await asyncio.wait_for(
+            call_ai(model, prompt, task_type="reasoning"),
+            timeout=SCAN_TRADE_TIMEOUT,
+        )
+    return response
+
+
+async def _manage_chat(
+    context: CallbackContext,
+    chat_id: int,
+    numbered: List[Tuple[int, sqlite3.Row]],
+    total: int,
+    sem: asyncio.Semaphore,
+    send_sem: asyncio.Semaphore,
+) -> None:
+    """Analyze one chat's trades concurrently, then send them as a single digest."""
+    model = resolve_model(chat_id, "manage")
+    results = await asyncio.gather(
+        *(_analyze_trade(trade, model, i, total, sem) for i, trade in numbered),
+        return_exceptions=True,
+    )
+
+    sections = []
+    for (_, trade), result in zip(numbered, results):
+        # Individual trade errors are reported in place so the rest of the digest still goes out
+        if isinstance(result, Exception):
+            logger.error("Failed to auto-manage trade %s: %s", trade["id"], result, exc_info=result)
+            result = f"⚠️ Analysis failed: {result}"
+        sections.append(f"🔔 Scheduled Check: {trade['ticker']} {trade['type']}\n\n{result}")
+
+    # Send outside the analysis slots so a slow recipient doesn't hold up LLM work.
+    await _send_to_chat(context, chat_id, "\n\n".join(sections), send_sem)
 
 
 async def scheduled_market_scan(context: CallbackContext) -> None:
     """
     Run management analysis for every open trade and push the results
     to the originating chat. Designed to be invoked by JobQueue.
+    Trades are analyzed concurrently, bounded by SCAN_CONCURRENCY, and each
+    chat gets one digest rather than a message per trade.
     """
     logger.info("Starting scheduled market scan...")
-    trades = get_all_open_trades()
+    trades = await asyncio.to_thread(get_all_open_trades)
 
     if not trades:
         logger.info("No open trades to scan.")
         return
 
-    logger.info(f"Found {len(trades)} open trades to scan.")
+    logger.info("Found %d open trades to scan.", len(trades))
 
     # enumerate(trades, 1) starts the counter at 1 for cleaner logs (e.g., "1/8")
+    by_chat: Dict[int, List[Tuple[int, sqlite3.Row]]] = defaultdict(list)
     for i, trade in enumerate(trades, 1):
-        try:
-            ticker = trade["ticker"]
-            chat_id = trade["chat_id"]
-            
-            # Log exactly which trade is being processed
-            logger.info(f"Processing {i}/{len(trades)}: Trade ID {trade['id']} ({ticker})")
-
-            market = get_market_data(ticker)
-            prompt = build_manage_prompt(trade, market)
-
-            model = resolve_model(chat_id, "manage")
-            
-            # Await the response to ensure we finish one trade before starting the next
-            response, _ = await call_ai(model, prompt, task_type="reasoning")
-
-            message = f"🔔 Scheduled Check: {ticker} {trade['type']}\n\n{response}"
-            
-            # FIX APPLIED: Removed parse_mode="Markdown"
-            # This ensures the message is delivered reliably as plain text,
-            # avoiding crashes if the AI generates special characters (like underscores).
-            await context.bot.send_message(chat_id=chat_id, text=message)
+        by_chat[trade["chat_id"]].append((i, trade))
 
-            # Sleep 2 seconds to prevent hitting API rate limits
-            await asyncio.sleep(2)
+    sem = asyncio.Semaphore(SCAN_CONCURRENCY)
+    send_sem = asyncio.Semaphore(SEND_CONCURRENCY)
+    results = await asyncio.gather(
+        *(_manage_chat(context, chat_id, numbered, len(trades), sem, send_sem) for chat_id, numbered in by_chat.items()),
+        return_exceptions=True,
+    )
+
+    for chat_id, result in zip(by_chat, results):
+        if isinstance(result, Exception):
+            logger.error("Scheduled check failed for chat %s: %s", chat_id, result, exc_info=result)
 
-        except Exception as exc:  # noqa: BLE001
-            # Catch individual trade errors so the entire batch doesn't fail
-            logger.error("Failed to auto-manage trade %s: %s", trade.get("id"), exc, exc_info=True)
-            
     logger.info("Scheduled market scan completed.")
 
 
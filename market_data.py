@@ -1,89 +1,292 @@
+import asyncio
 import logging
-from datetime import datetime
-from typing import Dict, List
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
 
+import pandas as pd
 import yfinance as yf
 
+from retry import is_transient, retry_async
+
 logger = logging.getLogger(__name__)
 
+# Up to six letters/digits, optionally joined by single dots or dashes (BRK.B, BF-B).
+_TICKER_RE = re.compile(r"\A[A-Z0-9](?:[.\-]?[A-Z0-9]){0,5}\Z")
+# Tickers may be separated by commas, whitespace or both ("AAPL,MSFT NVDA").
+_TICKER_SPLIT_RE = re.compile(r"[,\s]+")
+
+# Tickers users hit first (the /scan default and common picks); primed at startup.
+WARM_TICKERS = ("SOFI", "PLTR", "HOOD")
+
+# Attempts per fetch_market_data call when Yahoo fails with a transient error.
+MARKET_DATA_TRIES = 3
+
+# ticker -> (monotonic expiry, data). Quotes are reused for MARKET_CACHE_TTL seconds,
+# results without a price for MARKET_NEGATIVE_TTL.
+MARKET_CACHE_TTL = 60.0
+MARKET_NEGATIVE_TTL = 30.0
+MARKET_CACHE_MAX = 512
+_MARKET_CACHE: Dict[str, Tuple[float, Dict[str, str]]] = {}
+# Sectors don't change intraday, so they're kept for the life of the process.
+SECTOR_CACHE_MAX = 2048
+SECTOR_WORKERS = 8
+_SECTOR_CACHE: Dict[str, str] = {}
+# Writers run in worker threads (to_thread, the warm-up batch); eviction iterates
+# the dict, so inserts and evictions are serialized. Lookups are single dict reads.
+_CACHE_LOCK = threading.Lock()
+# Fetches in progress, so simultaneous requests for one ticker make one Yahoo call.
+_MARKET_INFLIGHT: Dict[str, "asyncio.Task[Dict[str, str]]"] = {}
+
+
+def _next_earnings_from_info(info: Dict) -> Optional[str]:
+    """Next earnings date from the quote summary, if Yahoo included a future one."""
+    now = time.time()
+    for key in ("earningsTimestampStart", "earningsTimestamp"):
+        ts = info.get(key)
+        if isinstance(ts, (int, float)) and ts > now:
+            return datetime.fromtimestamp(ts, tz=timezone.utc).strftime('%Y-%m-%d')
+    return None
+
 
-def get_market_data(ticker_symbol: str) -> Dict[str, str]:
+def _next_earnings_from_history(ticker: yf.Ticker) -> str:
+    """Fallback: scan the earnings_dates table (a separate, slow Yahoo request)."""
+    earnings_df = ticker.earnings_dates
+    if earnings_df is not None and not earnings_df.empty:
+        dates = earnings_df.index
+        # Compare in the index's own timezone rather than stripping it from every entry.
+        now = pd.Timestamp.now(tz=dates.tz)
+        # Yahoo lists newest first; reversing is a view, and a sorted index can be bisected.
+        if dates.is_monotonic_decreasing:
+            dates = dates[::-1]
+        elif not dates.is_monotonic_increasing:
+            dates = dates.sort_values()
+        pos = dates.searchsorted(now, side='right')
+
+        if pos < len(dates):
+            return dates[pos].strftime('%Y-%m-%d')
+        cal = ticker.calendar
+        if cal and not cal.empty:
+            return cal.iloc[0, 0].strftime('%Y-%m-%d')
+    return "Unknown"
+
+
+# Returned when a ticker's data couldn't be fetched at all.
+_UNAVAILABLE: Dict[str, str] = {
+    "price": "N/A",
+    "earnings": "Check Broker",
+    "iv_hint": "N/A",
+    "sector": "Unknown",
+    "dma_50": "N/A",
+    "dma_200": "N/A",
+}
+
+
+def get_market_data(ticker_symbol: str, ticker: Optional[yf.Ticker] = None) -> Dict[str, str]:
+    """
+    Fetch price, earnings and profile data. Pass ticker to reuse a yf.Ticker from a batch.
+    One info request normally covers everything; the price and earnings endpoints
+    are only hit when it comes back without them. Transient network errors are
+    raised for the caller to retry; other failures yield N/A fields.
+    """
     try:
-        ticker = yf.Ticker(ticker_symbol)
+        if ticker is None:
+            ticker = yf.Ticker(ticker_symbol)
 
-        price = "N/A"
+        info = {}
         try:
-            price = ticker.fast_info.last_price
-        except Exception:
+            info = ticker.info or {}
+        except Exception as e:
+            # Network trouble goes up to fetch_market_data's retry; anything else
+            # (e.g. a 404 for an unknown symbol) just means there's no profile.
+            if is_transient(e):
+                raise
+            logger.warning("Info fetch failed for %s: %s", ticker_symbol, e)
+
+        price = info.get("currentPrice") or info.get("regularMarketPrice") or "N/A"
+        if price == "N/A":
             try:
-                hist = ticker.history(period="1d")
-                if not hist.empty:
-                    price = hist["Close"].iloc[-1]
-            except Exception as e:
-                logger.warning("Price fetch failed for %s: %s", ticker_symbol, e)
+                price = ticker.fast_info.last_price
+            except Exception:
+                try:
+                    hist = ticker.history(period="1d")
+                    if not hist.empty:
+                        price = hist["Close"].iloc[-1]
+                except Exception as e:
+                    logger.warning("Price fetch failed for %s: %s", ticker_symbol, e)
 
         if isinstance(price, (int, float)):
             price = f"{price:.2f}"
 
-        next_earnings = "Unknown"
-        try:
-            earnings_df = ticker.earnings_dates
-            if earnings_df is not None and not earnings_df.empty:
-                future_dates = earnings_df.index[earnings_df.index.tz_localize(None) > datetime.now()]
-
-                if not future_dates.empty:
-                    next_earnings = future_dates.min().strftime('%Y-%m-%d')
-                else:
-                    cal = ticker.calendar
-                    if cal and not cal.empty:
-                        next_earnings = cal.iloc[0, 0].strftime('%Y-%m-%d')
-        except Exception as e:
-            logger.warning("Earnings fetch failed for %s: %s", ticker_symbol, e)
-
-        info = {}
-        try:
-            info = ticker.info
-        except Exception:
-            pass
+        next_earnings = _next_earnings_from_info(info)
+        if next_earnings is None:
+            try:
+                next_earnings = _next_earnings_from_history(ticker)
+            except Exception as e:
+                logger.warning("Earnings fetch failed for %s: %s", ticker_symbol, e)
+                next_earnings = "Unknown"
 
         return {
             "price": price,
             "earnings": next_earnings,
             "iv_hint": info.get("beta", "N/A"),
             "sector": info.get("sector", "Unknown"),
-            "dma_50": info.get("fifty_day_average", "N/A"),
-            "dma_200": info.get("two_hundred_day_average", "N/A"),
+            # info keys are camelCase; the snake_case names belong to fast_info.
+            "dma_50": info.get("fiftyDayAverage") or "N/A",
+            "dma_200": info.get("twoHundredDayAverage") or "N/A",
         }
 
     except Exception as e:
+        if is_transient(e):
+            raise
         logger.error("⚠️ Market Data Crash for %s: %s", ticker_symbol, e, exc_info=True)
-        return {"price": "N/A", "earnings": "Check Broker", "iv_hint": "N/A", "sector": "Unknown"}
+        return dict(_UNAVAILABLE)
+
+
+def _store_market_data(ticker_symbol: str, data: Dict[str, str]) -> None:
+    # Symbols without a price (unknown or delisted) are kept briefly too, so a bad
+    # ticker repeated across commands or scheduled rows isn't re-fetched each time.
+    ttl = MARKET_NEGATIVE_TTL if data["price"] == "N/A" else MARKET_CACHE_TTL
+    with _CACHE_LOCK:
+        if len(_MARKET_CACHE) >= MARKET_CACHE_MAX:
+            _MARKET_CACHE.pop(next(iter(_MARKET_CACHE)))
+        _MARKET_CACHE[ticker_symbol] = (time.monotonic() + ttl, data)
+
+
+def _cached(ticker_symbol: str) -> Optional[Dict[str, str]]:
+    hit = _MARKET_CACHE.get(ticker_symbol)
+    return hit[1] if hit and time.monotonic() < hit[0] else None
+
+
+def cached_market_data(ticker_symbol: str) -> Dict[str, str]:
+    """get_market_data, reusing any result fetched in the last MARKET_CACHE_TTL seconds."""
+    ticker_symbol = ticker_symbol.upper()
+    data = _cached(ticker_symbol)
+    if data is None:
+        data = get_market_data(ticker_symbol)
+        _store_market_data(ticker_symbol, data)
+    return data
+
+
+def get_market_data_batch(symbols: Iterable[str]) -> Dict[str, Dict[str, str]]:
+    """
+    Market data for several tickers. Uncached symbols are fetched through one
+    yf.Tickers object so they share a session instead of one setup per ticker.
+    """
+    result: Dict[str, Dict[str, str]] = {}
+    missing: List[str] = []
+    for sym in dict.fromkeys(s.upper() for s in symbols):
+        data = _cached(sym)
+        if data is None:
+            missing.append(sym)
+        else:
+            result[sym] = data
+
+    if missing:
+        try:
+            batch = yf.Tickers(" ".join(missing)).tickers
+        except Exception as e:
+            logger.warning("Batch ticker setup failed for %s: %s", missing, e)
+            batch = {}
+        for sym in missing:
+            try:
+                data = get_market_data(sym, batch.get(sym))
+            except Exception as e:
+                logger.warning("Market data fetch failed for %s: %s", sym, e)
+                result[sym] = dict(_UNAVAILABLE)
+                continue
+            _store_market_data(sym, data)
+            result[sym] = data
+    return result
+
+
+async def fetch_market_data(ticker_symbol: str) -> Dict[str, str]:
+    """
+    Async, cached front for get_market_data. yfinance is blocking, so the fetch
+    runs in a worker thread; results are reused for MARKET_CACHE_TTL seconds and
+    concurrent requests for the same ticker share a single fetch.
+    """
+    ticker_symbol = ticker_symbol.upper()
+    # Cache hits are a dict lookup; don't pay a worker-thread round trip for them.
+    data = _cached(ticker_symbol)
+    if data is not None:
+        return data
+
+    task = _MARKET_INFLIGHT.get(ticker_symbol)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_with_retry(ticker_symbol))
+        _MARKET_INFLIGHT[ticker_symbol] = task
+        task.add_done_callback(lambda _: _MARKET_INFLIGHT.pop(ticker_symbol, None))
+    return await asyncio.shield(task)
+
+
+async def _fetch_with_retry(ticker_symbol: str) -> Dict[str, str]:
+    # Only network errors and 429/5xx are retried; a symbol Yahoo doesn't know
+    # comes back once as N/A data rather than costing MARKET_DATA_TRIES fetches.
+    try:
+        return await retry_async(lambda: asyncio.to_thread(cached_market_data, ticker_symbol), tries=MARKET_DATA_TRIES)
+    except Exception as e:
+        logger.error("Market data unavailable for %s: %s", ticker_symbol, e)
+        return dict(_UNAVAILABLE)
+
+
+async def warm_market_data(tickers: Iterable[str] = WARM_TICKERS) -> None:
+    """Prime the market data cache so the first commands don't pay the fetch."""
+    await asyncio.to_thread(get_market_data_batch, tickers)
+    logger.info("Warmed market data cache for %s", ", ".join(tickers))
+
+
+def normalize_ticker(token: str) -> str:
+    # Deliberately not memoized: an lru_cache lookup costs more than strip().upper() on a symbol.
+    return token.strip().strip(',').upper()
 
 
 def normalize_tickers(tokens: List[str]) -> List[str]:
-    normalized = []
-    for token in tokens:
-        for part in token.split(','):
-            cleaned = part.strip().upper()
-            if cleaned:
-                normalized.append(cleaned)
-    return normalized
+    return [part.upper() for part in _TICKER_SPLIT_RE.split(" ".join(tokens)) if part]
 
 
 def is_ticker_like(token: str) -> bool:
-    token = token.strip().upper().strip(',')
-    if not token:
-        return False
-    cleaned = token.replace('.', '').replace('-', '')
-    return cleaned.isalnum() and token == token.upper() and len(cleaned) <= 6
+    return _TICKER_RE.match(normalize_ticker(token)) is not None
+
+
+def _fetch_sector(ticker_symbol: str) -> str:
+    """Sector only: one info request instead of get_market_data's price and earnings calls."""
+    try:
+        return yf.Ticker(ticker_symbol).info.get("sector") or "Unknown"
+    except Exception as e:
+        logger.warning("Sector fetch failed for %s: %s", ticker_symbol, e)
+        return "Unknown"
 
 
 def derive_sectors_for_tickers(tickers: List[str]) -> Dict[str, str]:
     sector_map: Dict[str, str] = {}
+    missing: List[str] = []
     for ticker in tickers:
-        data = get_market_data(ticker)
-        sector = data.get("sector") or "Unknown"
+        sym = ticker.upper()
+        sector = _SECTOR_CACHE.get(sym)
+        if sector is None:
+            data = _cached(sym)
+            sector = data.get("sector") if data else None
+        if sector is None:
+            missing.append(ticker)
+        else:
+            sector_map[ticker] = sector
+
+    if missing:
+        # Each lookup is one blocking HTTP round trip; overlap them.
+        with ThreadPoolExecutor(max_workers=min(SECTOR_WORKERS, len(missing))) as pool:
+            fetched = pool.map(_fetch_sector, [t.upper() for t in missing])
+        for ticker, sector in zip(missing, fetched):
+            sector_map[ticker] = sector
+
+    for ticker, sector in sector_map.items():
         if sector == "Unknown":
             logger.info("Sector not found for ticker %s", ticker)
-        sector_map[ticker] = sector
+            continue
+        with _CACHE_LOCK:
+            if len(_SECTOR_CACHE) < SECTOR_CACHE_MAX:
+                _SECTOR_CACHE[ticker.upper()] = sector
     return sector_map
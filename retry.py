@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import random
+from typing import Awaitable, Callable, List, TypeVar
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Status codes worth another attempt: rate limiting and upstream hiccups.
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+# Connection failures and timeouts from the HTTP stacks under the SDKs. requests and
+# curl_cffi (yfinance) and grpc (xai_sdk) come in with optional providers, so each is optional here.
+_network_errors: List[type] = [httpx.TransportError, asyncio.TimeoutError, ConnectionError, TimeoutError]
+try:
+    import requests.exceptions
+
+    _network_errors += [requests.exceptions.ConnectionError, requests.exceptions.Timeout]
+except ImportError:
+    pass
+try:
+    import curl_cffi.requests.exceptions
+
+    _network_errors += [curl_cffi.requests.exceptions.ConnectionError, curl_cffi.requests.exceptions.Timeout]
+except ImportError:
+    pass
+_NETWORK_ERRORS = tuple(_network_errors)
+
+try:
+    import grpc
+
+    _GRPC_RETRY_CODES = frozenset(
+        {grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.RESOURCE_EXHAUSTED, grpc.StatusCode.DEADLINE_EXCEEDED}
+    )
+except ImportError:
+    _GRPC_RETRY_CODES = frozenset()
+
+
+def is_transient(exc: BaseException) -> bool:
+    """True for network errors, timeouts and 429/5xx (or gRPC equivalents) from any provider SDK or yfinance."""
+    if isinstance(exc, _NETWORK_ERRORS):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRY_STATUSES
+    code = getattr(exc, "code", None)
+    if callable(code):
+        # grpc.RpcError (xai_sdk): .code() returns a grpc.StatusCode.
+        try:
+            return code() in _GRPC_RETRY_CODES
+        except Exception:  # noqa: BLE001
+            return False
+    # google-genai and most SDK errors carry the HTTP status as .code or .status_code;
+    # requests-style HTTP errors (yfinance's HTTP stack) carry it on .response.
+    status = getattr(exc, "status_code", None) or code
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return isinstance(status, int) and status in RETRY_STATUSES
+
+
+def backoff_delay(attempt: int, base: float = 0.5) -> float:
+    """Exponential backoff with a little jitter so concurrent retries spread out."""
+    return base * 2 ** attempt + random.random() * 0.1
+
+
+async def retry_async(fn: Callable[[], Awaitable[T]], tries: int = 3, base: float = 0.5) -> T:
+    """
+    Await fn(), retrying transient failures with exponential backoff.
+    fn must build a fresh awaitable per call, e.g. lambda: call_ai(model, prompt).
+    """
+    for attempt in range(tries - 1):
+        try:
+            return await fn()
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            delay = backoff_delay(attempt, base)
+            logger.warning("Transient error (%s), retry %d/%d in %.2fs", e, attempt + 1, tries - 1, delay)
+            await asyncio.sleep(delay)
+    return await fn()
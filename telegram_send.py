@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Awaitable, Callable, List, TypeVar
+
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Telegram allows roughly 30 messages/sec per bot; stay a little under it.
+SEND_RATE = 25.0
+SEND_BURST = 25
+
+# Longest reply sent inline (Telegram's cap is 4096); longer ones go as a file.
+MAX_MESSAGE_LENGTH = 4000
+# Replies up to this length are split over several messages; beyond it, one file is friendlier.
+MAX_SPLIT_LENGTH = 20000
+
+
+class TokenBucket:
+    """Async token bucket: acquire() waits until a token is available."""
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+_BUCKET = TokenBucket(SEND_RATE, SEND_BURST)
+
+
+async def safe_send(make_call: Callable[[], Awaitable[T]]) -> T:
+    """
+    Run a Telegram send (e.g. lambda: message.reply_text(text)) under the global
+    rate limit. On RetryAfter, wait as long as Telegram asks and try once more.
+    """
+    await _BUCKET.acquire()
+    try:
+        return await make_call()
+    except RetryAfter as e:
+        # retry_after is seconds in PTB 20 and a timedelta in newer releases.
+        delay = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else float(e.retry_after)
+        logger.warning("Telegram flood control, retrying in %.1fs", delay)
+        await asyncio.sleep(delay)
+        await _BUCKET.acquire()
+        return await make_call()
+
+
+def message_length(text: str) -> int:
+    """Length as Telegram counts it (UTF-16 code units); astral chars like emoji count twice."""
+    if text.isascii():
+        return len(text)
+    return len(text.encode('utf-16-le')) // 2
+
+
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """Split text into messages within limit, preferring paragraph, then line, then word breaks."""
+    parts = []
+    while message_length(text) > limit:
+        window = text[:limit]
+        # Astral characters (emoji) count as two units. Dropping half the excess in
+        # characters removes at least half of it in units, so this converges quickly
+        # without cutting far below the limit. Slicing a str never splits a surrogate pair.
+        excess = message_length(window) - limit
+        while excess > 0:
+            window = window[:len(window) - (excess + 1) // 2]
+            excess = message_length(window) - limit
+        cut = window.rfind("\n\n")
+        if cut < limit // 2:
+            cut = window.rfind("\n")
+        if cut < limit // 2:
+            cut = window.rfind(" ")
+        if cut <= 0:
+            # No break to use: hard cut, always taking at least one character.
+            cut = max(len(window), 1)
+        part = text[:cut].rstrip()
+        if part:
+            parts.append(part)
+        text = text[cut:].lstrip()
+    if text:
+        parts.append(text)
+    return parts
@@ -0,0 +1,28 @@
+import pytest
+
+from ai_engine import FRAMEWORK_CONTEXT, _cache_key
+
+
+def test_cache_key_ignores_case_and_spacing():
+    base = _cache_key("grok", "speed", FRAMEWORK_CONTEXT, "Sentiment for tech stocks")
+    assert _cache_key("grok", "speed", FRAMEWORK_CONTEXT, "  sentiment FOR\n tech   Stocks ") == base
+
+
+@pytest.mark.parametrize(
+    "model, task_type, context, prompt",
+    [
+        ("gemini", "speed", FRAMEWORK_CONTEXT, "Sentiment for tech stocks"),
+        ("grok", "reasoning", FRAMEWORK_CONTEXT, "Sentiment for tech stocks"),
+        ("grok", "speed", "other context", "Sentiment for tech stocks"),
+        ("grok", "speed", FRAMEWORK_CONTEXT, "Sentiment for energy stocks"),
+    ],
+)
+def test_cache_key_distinguishes_request_parts(model, task_type, context, prompt):
+    base = _cache_key("grok", "speed", FRAMEWORK_CONTEXT, "Sentiment for tech stocks")
+    assert _cache_key(model, task_type, context, prompt) != base
+
+
+def test_cache_key_is_stable_hex():
+    key = _cache_key("grok", "speed", FRAMEWORK_CONTEXT, "x")
+    assert key == _cache_key("grok", "speed", FRAMEWORK_CONTEXT, "x")
+    assert len(key) == 64 and int(key, 16) >= 0
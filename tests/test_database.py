@@ -0,0 +1,79 @@
+import sqlite3
+
+import pytest
+
+import database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Point the module at a fresh file and drop its cached connections afterwards."""
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "trades.db"))
+    monkeypatch.setattr(database, "_conn", None)
+    monkeypatch.setattr(database, "_ro_conn", None)
+    database._POSITIONS_CACHE.clear()
+    yield database
+    for conn in (database._conn, database._ro_conn):
+        if conn is not None:
+            conn.close()
+
+
+def _make_v3(db):
+    """A database at schema v3, with REAL money columns, holding one trade."""
+    conn = db._get_conn()
+    c = conn.cursor()
+    for number, migrate in enumerate(db._MIGRATIONS[:3], 1):
+        migrate(c)
+        c.execute(f"PRAGMA user_version={number}")
+    c.execute(
+        """INSERT INTO trades (chat_id, ticker, type, strike, long_strike, entry_price, date, expiry)
+                 VALUES (1, 'SOFI', 'BPS', 8.5, 7.5, 0.29, '2026-01-02', '01/17/2026')"""
+    )
+    conn.commit()
+    return conn
+
+
+def test_v4_migration_round_trips_values(db):
+    conn = _make_v3(db)
+    db.init_db()
+
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == db.SCHEMA_VERSION
+    stored = conn.execute("SELECT strike_cents, long_strike_cents, entry_price_cents FROM trades").fetchone()
+    # 0.29 * 100 is 28.999... in floating point; the migration must round, not truncate.
+    assert tuple(stored) == (850, 750, 29)
+
+    (trade,) = db.get_open_positions(1)
+    assert (trade["strike"], trade["long_strike"], trade["entry_price"]) == (8.5, 7.5, 0.29)
+
+
+def test_failed_migration_leaves_previous_version_intact(db, monkeypatch):
+    conn = _make_v3(db)
+
+    def broken_v4(c):
+        db._migrate_v4(c)
+        raise sqlite3.OperationalError("disk full")
+
+    migrations = db._MIGRATIONS
+    monkeypatch.setattr(db, "_MIGRATIONS", migrations[:3] + (broken_v4,))
+    with pytest.raises(sqlite3.OperationalError):
+        db.init_db()
+
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 3
+    tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    assert "trades_new" not in tables
+    assert conn.execute("SELECT entry_price FROM trades").fetchone()[0] == 0.29
+
+    # The next start retries the migration cleanly.
+    monkeypatch.setattr(db, "_MIGRATIONS", migrations)
+    db.init_db()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == db.SCHEMA_VERSION
+
+
+def test_new_database_matches_migrated_schema(db):
+    db.init_db()
+    trade_id = db.open_trade(7, "amd", "csp", 150.1, 1.15, "03/20/2026")
+    trade = db.get_trade_by_id(trade_id, 7)
+    assert (trade["ticker"], trade["strike"], trade["entry_price"]) == ("AMD", 150.1, 1.15)
+
+    assert db.update_trade_field(trade_id, 7, "entry_price", "0.3")
+    assert db.get_trade_by_id(trade_id, 7)["entry_price"] == 0.3
@@ -0,0 +1,97 @@
+import asyncio
+
+import grpc
+import httpx
+import pytest
+import requests
+
+from retry import is_transient, retry_async
+
+
+class _RpcError(grpc.RpcError):
+    def __init__(self, code):
+        self._code = code
+
+    def code(self):
+        return self._code
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def _http_status_error(status):
+    request = httpx.Request("GET", "https://example.com")
+    return httpx.HTTPStatusError("boom", request=request, response=httpx.Response(status, request=request))
+
+
+def _requests_http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError("boom", response=response)
+
+
+@pytest.mark.parametrize(
+    "exc",
+    [
+        httpx.ConnectError("refused"),
+        asyncio.TimeoutError(),
+        ConnectionResetError(),
+        requests.ConnectionError("reset"),
+        requests.ReadTimeout("slow"),
+        _http_status_error(429),
+        _http_status_error(503),
+        _requests_http_error(502),
+        _StatusError(500),
+        _RpcError(grpc.StatusCode.UNAVAILABLE),
+        _RpcError(grpc.StatusCode.RESOURCE_EXHAUSTED),
+        _RpcError(grpc.StatusCode.DEADLINE_EXCEEDED),
+    ],
+)
+def test_transient(exc):
+    assert is_transient(exc)
+
+
+@pytest.mark.parametrize(
+    "exc",
+    [
+        ValueError("bad"),
+        KeyError("price"),
+        FileNotFoundError("trades.db"),
+        PermissionError("denied"),
+        _http_status_error(400),
+        _requests_http_error(404),
+        _StatusError(401),
+        _RpcError(grpc.StatusCode.INVALID_ARGUMENT),
+        _RpcError(grpc.StatusCode.PERMISSION_DENIED),
+    ],
+)
+def test_not_transient(exc):
+    assert not is_transient(exc)
+
+
+def test_retry_async_retries_transient_then_succeeds(monkeypatch):
+    monkeypatch.setattr("retry.backoff_delay", lambda attempt, base=0.5: 0)
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise _RpcError(grpc.StatusCode.UNAVAILABLE)
+        return "ok"
+
+    assert asyncio.run(retry_async(flaky)) == "ok"
+    assert len(calls) == 3
+
+
+def test_retry_async_does_not_retry_permanent_errors():
+    calls = []
+
+    async def broken():
+        calls.append(1)
+        raise ValueError("bad prompt")
+
+    with pytest.raises(ValueError):
+        asyncio.run(retry_async(broken))
+    assert calls == [1]
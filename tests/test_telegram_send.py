@@ -0,0 +1,45 @@
+import pytest
+
+from telegram_send import MAX_MESSAGE_LENGTH, message_length, split_message
+
+
+def test_message_length_counts_utf16_units():
+    assert message_length("abc") == 3
+    assert message_length("é") == 1
+    assert message_length("😀") == 2
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "😀" * 5000,
+        "😀" * 3999 + " " + "b" * 10,
+        "word 😀 " * 3000,
+        "para one\n\n" * 1000,
+        "a" * 9000,
+    ],
+)
+def test_split_message_stays_within_limit(text):
+    parts = split_message(text)
+    assert all(0 < message_length(p) <= MAX_MESSAGE_LENGTH for p in parts)
+    # Only whitespace at the cut points is dropped.
+    assert "".join("".join(parts).split()) == "".join(text.split())
+
+
+def test_split_message_does_not_over_trim_emoji():
+    parts = split_message("😀" * 5000)
+    assert [message_length(p) for p in parts] == [4000, 4000, 2000]
+
+
+def test_split_message_always_makes_progress():
+    # A limit smaller than one astral character still consumes the input.
+    assert split_message("😀😀", limit=1) == ["😀", "😀"]
+
+
+def test_split_message_prefers_paragraph_breaks():
+    text = "a" * 3000 + "\n\n" + "b" * 3000
+    assert split_message(text) == ["a" * 3000, "b" * 3000]
+
+
+def test_short_message_is_unchanged():
+    assert split_message("hello") == ["hello"]